@@ -0,0 +1,92 @@
+import json
+import streamlit as st
+from RssDbPool import get_connection
+from RssWorkQueue import WorkQueue
+
+# Structured copy of the LLM analyses. RssOpenAiAnalyser stores the raw chat message
+# as text in a column named after the analysis profile (config.json); here every
+# result is parsed once into typed importance / sentiment / reason columns, keyed
+# by entry and profile, so readers filter with an index instead of decoding JSON.
+
+ANALYSIS_TABLE = "rss_analysis"
+
+
+def create_analysis_table(cursor):
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {ANALYSIS_TABLE} (
+        entry_rowid INT8 NOT NULL,
+        profile STRING NOT NULL,
+        importance STRING,
+        sentiment STRING,
+        reason STRING,
+        raw JSONB,
+        analyzed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (entry_rowid, profile),
+        INDEX {ANALYSIS_TABLE}_profile_importance_idx (profile, importance)
+    )
+    ''')
+
+
+def _normalize(value):
+    return value.strip().lower() if isinstance(value, str) and value.strip() else None
+
+
+def parse_analysis(analysis_text):
+    """
+    Split a stored chat message into (importance, sentiment, reason, raw JSON text).
+    Importance and sentiment are lower-cased; unparseable analyses get importance 'unknown'.
+    """
+    try:
+        data = json.loads(json.loads(analysis_text)["content"])
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return "unknown", None, None, None
+    if not isinstance(data, dict):
+        return "unknown", None, None, json.dumps(data)
+
+    reason = data.get("Reason")
+    return (
+        _normalize(data.get("Importance")) or "unknown",
+        _normalize(data.get("Sentiment")),
+        reason if isinstance(reason, str) else None,
+        json.dumps(data),
+    )
+
+
+def high_importance_filter(profile):
+    """WHERE clause fragment and params selecting the entries with high importance for profile."""
+    return (
+        f"rowid IN (SELECT entry_rowid FROM {ANALYSIS_TABLE} WHERE profile = %s AND importance = 'high')",
+        [profile],
+    )
+
+
+def sync_analyses(db_params, table_name, profile):
+    """Parse the analyses of table_name that have no structured row for profile yet."""
+    with get_connection(db_params) as conn:
+        create_analysis_table(conn.cursor())
+
+    queue = WorkQueue(
+        db_params, table_name, [f'"{profile}"'],
+        where_clause=f'''"{profile}" IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM {ANALYSIS_TABLE} a WHERE a.entry_rowid = {table_name}.rowid AND a.profile = %s
+        )''',
+        update_query=f'''UPSERT INTO {ANALYSIS_TABLE} (entry_rowid, profile, importance, sentiment, reason, raw)
+        VALUES (%s, %s, %s, %s, %s, %s)''',
+        params=[profile],
+    )
+    synced = queue.run(lambda rows: [(rowid, profile) + parse_analysis(analysis) for rowid, analysis in rows])
+    print(f"Stored {synced} structured analyses for {profile} from {table_name}")
+    return synced
+
+
+if __name__ == "__main__":
+
+    def load_config():
+        with open("/Users/danieltremer/Documents/RssFeed_Analyser/rss-frontend-repo/rss_pipeline_scripts/config.json", "r") as file:
+            return json.load(file)
+
+    config = load_config()
+    ANALYSIS_COLUMN_NAME = config["params"]["ANALYSIS_COLUMN_NAME_BASE"] + config["suffixes"]["ANALYSIS_COLUMN_NAME"]
+    DATABASE_PATH = st.secrets["cockroachdb"]["connection_string"]
+
+    sync_analyses(DATABASE_PATH, "rss_entries", ANALYSIS_COLUMN_NAME)
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from newspaper import Article
+from RssRateLimiter import DomainLimiter
+
+# Downloads article pages for tweet generation. Extracted text is cached per URL
+# in a local SQLite file together with the ETag / Last-Modified validators, so
+# re-runs and regenerations do not download or parse the same article again.
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "article_cache.sqlite3")
+CONTENT_MAX_AGE_SECONDS = 24 * 3600  # Cached text younger than this is used without revalidating
+PER_DOMAIN_LIMIT = 2  # Concurrent downloads per domain
+PER_DOMAIN_INTERVAL = 1.0  # Minimum seconds between two requests to the same domain
+REQUEST_TIMEOUT = 10
+USER_AGENT = "Mozilla/5.0 (compatible; RssAnalyser/1.0)"
+
+
+class ArticleCache:
+
+    def __init__(self, path=CACHE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS article_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            text TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        )
+        ''')
+        self._conn.commit()
+
+    def get(self, url):
+        """Return (etag, last_modified, text, fetched_at) or None."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT etag, last_modified, text, fetched_at FROM article_cache WHERE url = ?", (url,)
+            ).fetchone()
+
+    def set(self, url, etag, last_modified, text):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO article_cache (url, etag, last_modified, text, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, text, time.time())
+            )
+            self._conn.commit()
+
+    def touch(self, url):
+        with self._lock:
+            self._conn.execute("UPDATE article_cache SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+
+class ArticleFetcher:
+    """Thread-safe article downloader with per-domain politeness limits and a content cache."""
+
+    def __init__(self, cache=None, per_domain_limit=PER_DOMAIN_LIMIT, per_domain_interval=PER_DOMAIN_INTERVAL,
+                 max_age_seconds=CONTENT_MAX_AGE_SECONDS):
+        self.cache = cache or ArticleCache()
+        self.domains = DomainLimiter(per_domain_limit, per_domain_interval)
+        self.max_age_seconds = max_age_seconds
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()  # fetch runs on many worker threads
+        self.cache_hits = 0
+        self.not_modified = 0
+        self.downloads = 0
+        self.failures = 0
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            self._local.session.headers["User-Agent"] = USER_AGENT
+        return self._local.session
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def fetch(self, link):
+        """Return the article text of link, or None if it could not be fetched."""
+        cached = self.cache.get(link)
+        if cached and time.time() - cached[3] < self.max_age_seconds:
+            self._count("cache_hits")
+            return cached[2]
+
+        headers = {}
+        if cached and cached[0]:
+            headers["If-None-Match"] = cached[0]
+        if cached and cached[1]:
+            headers["If-Modified-Since"] = cached[1]
+
+        try:
+            with self.domains.limit(link):
+                response = self._session().get(link, headers=headers, timeout=REQUEST_TIMEOUT)
+
+            if response.status_code == 304 and cached:
+                self._count("not_modified")
+                self.cache.touch(link)
+                return cached[2]
+
+            # Error pages (404, 429 beyond what the domain limiter absorbs, 5xx...) are neither parsed nor cached
+            if not 200 <= response.status_code < 300:
+                self._count("failures")
+                print(f"Failed to fetch content for link {link}. HTTP status {response.status_code}")
+                return None
+
+            self._count("downloads")
+            article = Article(link)
+            article.download(input_html=response.text)
+            article.parse()
+            self.cache.set(link, response.headers.get("ETag"), response.headers.get("Last-Modified"), article.text)
+            return article.text
+        except Exception as e:
+            self._count("failures")
+            print(f"Failed to fetch content for link {link}. Error: {e}")
+            return None
+
+    def report(self):
+        print(f"Articles: {self.downloads} downloaded, {self.not_modified} not modified, {self.cache_hits} from cache, "
+              f"{self.failures} failed")
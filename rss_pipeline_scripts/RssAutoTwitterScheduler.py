@@ -8,12 +8,13 @@ import uuid
 from supabase import create_client, Client
 import json
 import psycopg2
+from RssDbPool import get_connection, run_transaction
+from RssEmbeddingCodec import decode_embedding
+from RssSimilarityIndex import SimilarityIndex, load_scheduled_embeddings
+from RssAnalysisStore import ANALYSIS_TABLE
 import uuid
-from sklearn.metrics.pairwise import cosine_similarity
 import random
-import ast
 import base64
-import numpy as np
 
 def load_config():
     with open("/Users/danieltremer/Documents/RssFeed_Analyser/rss-frontend-repo/rss_pipeline_scripts/config.json", "r") as file:
@@ -139,61 +140,58 @@ def schedule_tweet(input_uuid, api_key, api_secret, access_token, access_token_s
 def fetch_generated_tweets_from_db(db_params, days_back, selected_class):
     try:
         # Connect to the database
-        conn = psycopg2.connect(db_params)
-        cursor = conn.cursor()
+        with get_connection(db_params) as conn:
+            cursor = conn.cursor()
 
-        # Calculate the date x days back from today
-        past_date = (datetime.datetime.now() - datetime.timedelta(days=days_back)).strftime('%Y-%m-%d')
+            # Calculate the date x days back from today
+            past_date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days_back)
         
-        # Fetch table names with the prefix "rss_entries_"
-        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_name LIKE 'rss_entries';")
-        tables = cursor.fetchall()
+            # Fetch table names with the prefix "rss_entries_"
+            cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_name LIKE 'rss_entries';")
+            tables = cursor.fetchall()
 
-        # List to store tweets, links, titles, published dates, publishers, and reasons
-        tweets_data = []
+            # List to store tweets, links, titles, published dates, publishers, and reasons
+            tweets_data = []
 
-        for table in tables:
-            table_name = table[0]
+            for table in tables:
+                table_name = table[0]
             
-            # Construct WHERE clause for date filtering and optional class filtering
-            where_clauses = [f"published >= '{past_date}'"]
-            if selected_class != "All Classes":
-                where_clauses.append(f"class = '{selected_class}'")
-
-            where_clause = " AND ".join(where_clauses)
-
-            # Fetch generated_tweet, link, title, published_date, publisher, class, and ANALYSIS_COLUMN_NAME
-            cursor.execute(f"SELECT title, link, class, \"{TWEET_COLUMN_NAME}\", published, publisher, \"{ANALYSIS_COLUMN_NAME}\", embedding FROM {table_name} WHERE {where_clause};")
-            entries = cursor.fetchall()
-
-            for entry in entries:
-                title, link, tweet_class, tweet, published_date, publisher, analysis_data, embedding = entry
-
-
-                if tweet != None and tweet != "No content due to empty article content.":
-
-                    # Extract reason from the analysis_data
-                    try:
-                        outer_json = json.loads(analysis_data)
-                        inner_json_str = outer_json.get("content", "{}")
-                        inner_json = json.loads(inner_json_str)
-                        reason = inner_json.get("Reason", "Unknown Reason")
-                    except:
-                        reason = "Error decoding reason"
-
-                    tweets_data.append({
-                        "title": title,
-                        "link": link,
-                        "class": tweet_class,
-                        "tweet": tweet,
-                        "published": published_date,
-                        "publisher": publisher,
-                        "reason": reason,
-                        "embedding": embedding
-                    })
-
-        cursor.close()
-        conn.close()
+                # Construct WHERE clause for date filtering and optional class filtering
+                where_clauses = ["published_at >= %s", f"\"{TWEET_COLUMN_NAME}\" IS NOT NULL"]
+                params = [ANALYSIS_COLUMN_NAME, past_date]
+                if selected_class != "All Classes":
+                    where_clauses.append("class = %s")
+                    params.append(selected_class)
+
+                where_clause = " AND ".join(where_clauses)
+
+                # Fetch generated_tweet, link, title, published_date, publisher, class and the parsed reason
+                cursor.execute(f'''
+                SELECT title, link, class, "{TWEET_COLUMN_NAME}", published, publisher, a.reason, embedding_bin, embedding
+                FROM {table_name} e
+                LEFT JOIN {ANALYSIS_TABLE} a ON a.entry_rowid = e.rowid AND a.profile = %s
+                WHERE {where_clause};
+                ''', params)
+                entries = cursor.fetchall()
+
+                for entry in entries:
+                    title, link, tweet_class, tweet, published_date, publisher, reason, embedding_bin, embedding = entry
+                    # Rows not migrated yet still carry the JSON text embedding
+                    embedding = bytes(embedding_bin) if embedding_bin is not None else embedding
+
+                    if tweet != "No content due to empty article content.":
+                        tweets_data.append({
+                            "title": title,
+                            "link": link,
+                            "class": tweet_class,
+                            "tweet": tweet,
+                            "published": published_date,
+                            "publisher": publisher,
+                            "reason": reason or "Unknown Reason",
+                            "embedding": embedding
+                        })
+
+            cursor.close()
         
         return tweets_data
 
@@ -231,32 +229,13 @@ def delete_scheduled_tweet(tweet_id):
     supabase.table('tweet_chunks').delete().eq('tweet_id', tweet_id).execute()
     return delete_response
 
-def str_to_list(embedding_str):
-    """Convert a string representation of a list to an actual list of floats."""
-    try:
-        return [float(x) for x in ast.literal_eval(embedding_str)]
-    except (ValueError, SyntaxError):
-        raise ValueError("Invalid string format for embedding")
-    
-def calculate_cosine_similarity(embedding1, embedding2):
-    """Calculate cosine similarity between two embeddings using sklearn."""
-    # Convert embeddings to numpy arrays if they aren't already
-    embedding1 = np.array(embedding1)
-    embedding2 = np.array(embedding2)
-    return cosine_similarity([embedding1], [embedding2])[0][0]
-
-def is_similar(embedding1_str, embedding2_str, threshold=0.8):
-    """Check if two embeddings are similar based on a threshold."""
-    embedding1 = str_to_list(embedding1_str)
-    embedding2 = str_to_list(embedding2_str)
-    similarity = calculate_cosine_similarity(embedding1, embedding2)
-    return similarity > threshold
-
-def schedule_tweets_over_day(tweets_data, input_uuid, api_data, db_params, hour_start=0, hour_end=24):
+def schedule_tweets_over_day(tweets_data, input_uuid, api_data, db_params, hour_start=0, hour_end=24, similarity_threshold=0.8):
     """Schedule tweets over the day."""
+    if not tweets_data:
+        return
     
     # Store the embeddings of already scheduled tweets
-    scheduled_embeddings = []
+    scheduled_embeddings = SimilarityIndex()
 
     # Calculate time intervals
     total_tweets = len(tweets_data)
@@ -265,96 +244,7 @@ def schedule_tweets_over_day(tweets_data, input_uuid, api_data, db_params, hour_
     # Start scheduling from the current time, not the beginning of the day
     current_time = datetime.datetime.now()
 
-    conn = psycopg2.connect(db_params)
-    cursor = conn.cursor()
-
-    # Check if the 'scheduled' column exists
-    cursor.execute("""
-        SELECT column_name 
-        FROM information_schema.columns 
-        WHERE table_name='rss_entries' AND column_name='scheduled';
-    """)
-    column_exists = cursor.fetchone()
-
-    # If 'scheduled' column doesn't exist, create it
-    if not column_exists:
-        cursor.execute("ALTER TABLE rss_entries ADD COLUMN scheduled BOOLEAN DEFAULT FALSE;")
-        conn.commit()
-
-    for tweet_data in tweets_data:
-        tweet_embedding = tweet_data["embedding"]
-        link = tweet_data["link"]
-
-        # Check if the tweet is already scheduled
-        cursor.execute("SELECT scheduled FROM rss_entries WHERE link = %s;", (link,))
-        is_scheduled = cursor.fetchone()
-        if is_scheduled and is_scheduled[0]:
-            print(f"Tweet '{tweet_data['title']}' is already scheduled.")
-            continue
-        
-        # Check if current tweet's embedding is similar to any already scheduled tweet
-        similar_scheduled = [se for se in scheduled_embeddings if is_similar(tweet_embedding, se)]
-        
-        if similar_scheduled:
-            print(f"Tweet '{tweet_data['title']}' is similar to already scheduled tweets.")
-            continue
-
-        tweet = tweet_data["tweet"].strip('"')
-        if len(tweet) > 280:
-            chunks = tweet.split('\\n\\n')
-            # chunks = [chunk.lstrip('\n\n') for chunk in chunks]  # Remove any leading '\n' characters from each chunk
-        else:
-            chunks = [tweet]
-
-        chunks = [chunk for chunk in chunks if chunk.strip()]
-
-        # Check each chunk for length > 280 and split if necessary
-        final_chunks = []
-        for chunk in chunks:
-            while len(chunk) > 280:
-                # Find the nearest whitespace before the 280-character limit
-                split_index = chunk.rfind(' ', 0, 280)
-                
-                # If we can't find a whitespace, split at 280 characters anyway
-                split_index = split_index if split_index != -1 else 280
-                
-                final_chunks.append(chunk[:split_index])
-                chunk = chunk[split_index:].lstrip()  # Remove leading whitespace from the remaining chunk
-
-            final_chunks.append(chunk)
-
-        chunks = final_chunks
-
-        # Always add the link as an extra chunk to be posted as a reply.
-        chunks.append(link)
-
-        print(chunks)
-
-        # Randomly schedule a tweet within the interval to add randomness
-        random_seconds = random.randint(0, interval_in_seconds - 1)
-        scheduled_datetime = current_time + datetime.timedelta(seconds=random_seconds)
-        
-        # Schedule the tweet using the provided function
-        schedule_tweet(input_uuid, api_data["api_key"], api_data["api_secret"], api_data["access_token"], 
-                       api_data["access_token_secret"], chunks, scheduled_datetime)
-        
-        # Move to the next interval
-        current_time += datetime.timedelta(seconds=interval_in_seconds)
-        
-        # Add the embedding of the scheduled tweet to the list
-        scheduled_embeddings.append(tweet_embedding)
-
-        # If scheduled time exceeds the hour_end, reset
-        if current_time.hour >= hour_end:
-            current_time = datetime.datetime.now()  # Reset to the current time
-
-    cursor.close()
-    conn.close()
-
-def mark_scheduled_in_db(tweets_data, db_params):
-    """Mark tweets as scheduled in CockroachDB."""
-    try:
-        conn = psycopg2.connect(db_params)
+    with get_connection(db_params) as conn:
         cursor = conn.cursor()
 
         # Check if the 'scheduled' column exists
@@ -370,14 +260,107 @@ def mark_scheduled_in_db(tweets_data, db_params):
             cursor.execute("ALTER TABLE rss_entries ADD COLUMN scheduled BOOLEAN DEFAULT FALSE;")
             conn.commit()
 
-        # Update the 'scheduled' column for each tweet
-        for tweet_data in tweets_data:
+        # Look up all already scheduled candidates at once
+        cursor.execute("SELECT link FROM rss_entries WHERE scheduled = TRUE AND link = ANY(%s);", ([tweet_data["link"] for tweet_data in tweets_data],))
+        already_scheduled = {row[0] for row in cursor.fetchall()}
+
+        load_scheduled_embeddings(cursor, scheduled_embeddings)
+
+        # Parse each embedding once and find the candidates that are not similar to
+        # earlier scheduled tweets or to each other
+        eligible = [i for i, tweet_data in enumerate(tweets_data) if tweet_data["link"] not in already_scheduled]
+        vectors = [SimilarityIndex.normalize(decode_embedding(tweets_data[i]["embedding"])) for i in eligible]
+        unique_rows = {eligible[position] for position in scheduled_embeddings.select_unique(vectors, similarity_threshold)}
+
+        for row, tweet_data in enumerate(tweets_data):
             link = tweet_data["link"]
-            cursor.execute(f"UPDATE rss_entries SET scheduled = TRUE WHERE link = %s;", (link,))
 
-        conn.commit()
+            # Check if the tweet is already scheduled
+            if link in already_scheduled:
+                print(f"Tweet '{tweet_data['title']}' is already scheduled.")
+                continue
+        
+            # Check if current tweet's embedding is similar to any already scheduled tweet
+            similar_scheduled = row not in unique_rows
+        
+            if similar_scheduled:
+                print(f"Tweet '{tweet_data['title']}' is similar to already scheduled tweets.")
+                continue
+
+            tweet = tweet_data["tweet"].strip('"')
+            if len(tweet) > 280:
+                chunks = tweet.split('\\n\\n')
+                # chunks = [chunk.lstrip('\n\n') for chunk in chunks]  # Remove any leading '\n' characters from each chunk
+            else:
+                chunks = [tweet]
+
+            chunks = [chunk for chunk in chunks if chunk.strip()]
+
+            # Check each chunk for length > 280 and split if necessary
+            final_chunks = []
+            for chunk in chunks:
+                while len(chunk) > 280:
+                    # Find the nearest whitespace before the 280-character limit
+                    split_index = chunk.rfind(' ', 0, 280)
+                
+                    # If we can't find a whitespace, split at 280 characters anyway
+                    split_index = split_index if split_index != -1 else 280
+                
+                    final_chunks.append(chunk[:split_index])
+                    chunk = chunk[split_index:].lstrip()  # Remove leading whitespace from the remaining chunk
+
+                final_chunks.append(chunk)
+
+            chunks = final_chunks
+
+            # Always add the link as an extra chunk to be posted as a reply.
+            chunks.append(link)
+
+            print(chunks)
+
+            # Randomly schedule a tweet within the interval to add randomness
+            random_seconds = random.randint(0, interval_in_seconds - 1)
+            scheduled_datetime = current_time + datetime.timedelta(seconds=random_seconds)
+        
+            # Schedule the tweet using the provided function
+            schedule_tweet(input_uuid, api_data["api_key"], api_data["api_secret"], api_data["access_token"], 
+                           api_data["access_token_secret"], chunks, scheduled_datetime)
+        
+            # Move to the next interval
+            current_time += datetime.timedelta(seconds=interval_in_seconds)
+        
+            already_scheduled.add(link)
+
+            # If scheduled time exceeds the hour_end, reset
+            if current_time.hour >= hour_end:
+                current_time = datetime.datetime.now()  # Reset to the current time
+
         cursor.close()
-        conn.close()
+
+def mark_scheduled_in_db(tweets_data, db_params):
+    """Mark tweets as scheduled in CockroachDB."""
+    try:
+        with get_connection(db_params) as conn:
+            cursor = conn.cursor()
+
+            # Check if the 'scheduled' column exists
+            cursor.execute("""
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name='rss_entries' AND column_name='scheduled';
+            """)
+            column_exists = cursor.fetchone()
+
+            # If 'scheduled' column doesn't exist, create it
+            if not column_exists:
+                cursor.execute("ALTER TABLE rss_entries ADD COLUMN scheduled BOOLEAN DEFAULT FALSE;")
+                conn.commit()
+
+            cursor.close()
+
+        # Update the 'scheduled' column for all tweets at once, retried on CockroachDB conflicts
+        links = [tweet_data["link"] for tweet_data in tweets_data]
+        run_transaction(db_params, lambda conn: conn.cursor().execute("UPDATE rss_entries SET scheduled = TRUE WHERE link = ANY(%s);", (links,)))
     except Exception as e:
         print(f"Failed to mark tweets as scheduled in database. Error: {e}")
 
@@ -0,0 +1,98 @@
+import calendar
+import threading
+from functools import lru_cache
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Normalizes feed entry dates to aware UTC datetimes. feedparser already parses
+# most dates into published_parsed / updated_parsed (UTC struct_time); the text is
+# only parsed when those are missing. Each feed uses one format for all its
+# entries, so the format that worked last is remembered per feed and tried first;
+# feeds are re-read every run, so parsed strings are cached as well.
+
+DATE_FORMATS = [
+    "%a, %d %b %Y %H:%M:%S %z",     # RFC 822 with numeric offset
+    "%a, %d %b %Y %H:%M:%S %Z",     # RFC 822 with GMT / UTC
+    "%Y-%m-%dT%H:%M:%S%z",          # ISO 8601 / Atom
+    "%Y-%m-%dT%H:%M:%S.%f%z",
+    "%Y-%m-%d %H:%M:%S%z",
+    "%Y-%m-%d %H:%M:%S",
+    "%a, %d %b %Y %H:%M %z",
+    "%d %b %Y %H:%M:%S %z",
+    "%Y-%m-%d",
+]
+
+_feed_formats = {}
+_feed_formats_lock = threading.Lock()
+
+
+def _to_utc(parsed):
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def struct_to_datetime(struct):
+    """feedparser's *_parsed values are UTC struct_time tuples."""
+    return datetime.fromtimestamp(calendar.timegm(struct), tz=timezone.utc)
+
+
+@lru_cache(maxsize=65536)
+def _parse_with_format(value, date_format):
+    try:
+        return _to_utc(datetime.strptime(value, date_format))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=16384)
+def _parse_fallback(value):
+    """Formats outside DATE_FORMATS: RFC 822 with named zones (EST, PDT...) and other ISO 8601 variants."""
+    try:
+        return _to_utc(parsedate_to_datetime(value))
+    except (TypeError, ValueError, IndexError):
+        pass
+    try:
+        return _to_utc(datetime.fromisoformat(value.replace("Z", "+00:00")))
+    except ValueError:
+        return None
+
+
+def parse_date(value, feed_key=None):
+    """
+    Parse a date string to an aware UTC datetime, None if it is not a date.
+    With a feed_key, the format that last worked for that feed is tried first.
+    """
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip()
+
+    known_format = _feed_formats.get(feed_key) if feed_key is not None else None
+    if known_format is not None:
+        parsed = _parse_with_format(value, known_format)
+        if parsed is not None:
+            return parsed
+
+    for date_format in DATE_FORMATS:
+        if date_format == known_format:
+            continue
+        parsed = _parse_with_format(value, date_format)
+        if parsed is not None:
+            if feed_key is not None:
+                with _feed_formats_lock:
+                    _feed_formats[feed_key] = date_format
+            return parsed
+
+    return _parse_fallback(value)
+
+
+def entry_datetime(entry, feed_key=None):
+    """Publication time of a feedparser entry (published, else updated) as aware UTC datetime."""
+    for parsed_key, text_key in (("published_parsed", "published"), ("updated_parsed", "updated")):
+        struct = entry.get(parsed_key)
+        if struct:
+            return struct_to_datetime(struct)
+        parsed = parse_date(entry.get(text_key), feed_key)
+        if parsed is not None:
+            return parsed
+    return None
@@ -0,0 +1,123 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.pool
+import streamlit as st
+
+# Shared connection pool for all pipeline stages. Opening a connection to the
+# cluster costs a TLS handshake, so connections are checked out and returned
+# here instead of calling psycopg2.connect for every operation.
+
+POOL_MIN_SIZE = int(st.secrets["cockroachdb"].get("pool_min_size", 1))
+POOL_MAX_SIZE = int(st.secrets["cockroachdb"].get("pool_max_size", 10))
+HEALTH_CHECK_INTERVAL = 30  # Seconds a connection may sit idle before it is pinged on checkout
+MAX_TRANSACTION_RETRIES = 5
+
+SERIALIZATION_FAILURE = "40001"  # CockroachDB asks the client to retry the transaction
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class _BlockingPool:
+    """ThreadedConnectionPool that waits for a free connection instead of raising when exhausted."""
+
+    def __init__(self, dsn, min_size, max_size):
+        self._pool = psycopg2.pool.ThreadedConnectionPool(min_size, max_size, dsn)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {}
+
+    def getconn(self):
+        self._slots.acquire()
+        try:
+            conn = self._pool.getconn()
+            if not self._is_healthy(conn):
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        try:
+            self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+def get_pool(dsn):
+    """Return the pool for dsn, creating it on first use."""
+    with _pools_lock:
+        if dsn not in _pools:
+            _pools[dsn] = _BlockingPool(dsn, POOL_MIN_SIZE, POOL_MAX_SIZE)
+        return _pools[dsn]
+
+
+@contextmanager
+def get_connection(dsn):
+    """
+    Check out a pooled connection. Like `with psycopg2.connect(dsn) as conn`, the
+    transaction is committed when the block exits normally and rolled back on an
+    exception; the connection then goes back to the pool instead of being closed.
+    """
+    pool = get_pool(dsn)
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                # The connection is unusable, putconn closes it
+                conn.close()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def run_transaction(dsn, func, max_retries=MAX_TRANSACTION_RETRIES):
+    """
+    Run func(conn) in a transaction and return its result. The transaction is
+    retried with backoff on serialization failures (40001) and dropped connections.
+    """
+    for attempt in range(1, max_retries + 1):
+        try:
+            with get_connection(dsn) as conn:
+                return func(conn)
+        except psycopg2.Error as e:
+            # A serialization failure is an OperationalError too, so it is covered here
+            retryable = e.pgcode == SERIALIZATION_FAILURE or isinstance(e, psycopg2.OperationalError)
+            if not retryable or attempt == max_retries:
+                raise
+            print(f"Retrying transaction after error ({attempt} of {max_retries}): {e}")
+            time.sleep(min(0.1 * 2 ** attempt, 5) * (1 + random.random()))
+
+
+def close_all_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
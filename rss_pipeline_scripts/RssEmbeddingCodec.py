@@ -0,0 +1,111 @@
+import json
+import struct
+import numpy as np
+import psycopg2.extras
+import streamlit as st
+from RssDbPool import get_connection, run_transaction
+
+# Embeddings are stored in rss_entries.embedding_bin as a small header followed by
+# the raw vector: magic (2 bytes), format version, dtype code, dimension (uint16).
+MAGIC = b"EM"
+VERSION = 1
+HEADER = struct.Struct("<2sBBH")
+
+DTYPES = {1: np.dtype("<f2"), 2: np.dtype("<f4")}
+DTYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+
+DEFAULT_DTYPE = "float16"
+EMBEDDING_COLUMN = "embedding_bin"
+LEGACY_EMBEDDING_COLUMN = "embedding"
+
+
+def encode_embedding(embedding, dtype=DEFAULT_DTYPE):
+    """Pack a 1-d embedding (list, numpy array or torch tensor) into bytes."""
+    if hasattr(embedding, "detach"):
+        embedding = embedding.detach().cpu().numpy()
+    dtype = np.dtype(dtype).newbyteorder("<")
+    vector = np.asarray(embedding, dtype=dtype).reshape(-1)
+    return HEADER.pack(MAGIC, VERSION, DTYPE_CODES[dtype], vector.size) + vector.tobytes()
+
+
+def decode_embedding(value):
+    """
+    Return the embedding as a float32 numpy array. Accepts the binary format
+    and the legacy JSON text format; None or an empty value gives an empty array.
+    """
+    if value is None:
+        return np.empty(0, dtype=np.float32)
+    if isinstance(value, str):
+        return np.asarray(json.loads(value) if value else [], dtype=np.float32)
+
+    value = bytes(value)
+    if len(value) < HEADER.size:
+        return np.empty(0, dtype=np.float32)
+    magic, version, dtype_code, dim = HEADER.unpack_from(value)
+    if magic != MAGIC or version != VERSION or dtype_code not in DTYPES:
+        raise ValueError("Unknown embedding format")
+    return np.frombuffer(value, dtype=DTYPES[dtype_code], count=dim, offset=HEADER.size).astype(np.float32)
+
+
+def add_embedding_column(cursor, table_name="rss_entries"):
+    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {EMBEDDING_COLUMN} BYTEA;")
+
+
+def convert_legacy_rows(rows, dtype=DEFAULT_DTYPE):
+    """
+    Encode (rowid, JSON text) rows. Returns (updates, malformed): updates are
+    (embedding_bin, rowid) parameters; a malformed or truncated embedding gets
+    embedding_bin NULL, so its text is still cleared, and its rowid is listed in malformed.
+    """
+    updates = []
+    malformed = []
+    for rowid, text in rows:
+        try:
+            updates.append((psycopg2.Binary(encode_embedding(decode_embedding(text), dtype)), rowid))
+        except (ValueError, TypeError):
+            updates.append((None, rowid))
+            malformed.append(rowid)
+    return updates, malformed
+
+
+def migrate_embeddings(cockroachdb_conn_str, table_name="rss_entries", batch_size=500, dtype=DEFAULT_DTYPE):
+    """
+    Convert JSON text embeddings to the binary column in batches, one transaction
+    per batch, and clear the text column of every converted row. Rows whose text
+    is not a valid embedding are cleared without a binary value and counted.
+    """
+    with get_connection(cockroachdb_conn_str) as conn:
+        add_embedding_column(conn.cursor(), table_name)
+
+    def convert_batch(conn):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        SELECT rowid, {LEGACY_EMBEDDING_COLUMN} FROM {table_name}
+        WHERE {LEGACY_EMBEDDING_COLUMN} IS NOT NULL
+        LIMIT %s
+        ''', (batch_size,))
+        rows = cursor.fetchall()
+        updates, malformed = convert_legacy_rows(rows, dtype)
+        psycopg2.extras.execute_batch(cursor, f'''
+        UPDATE {table_name} SET {EMBEDDING_COLUMN} = %s, {LEGACY_EMBEDDING_COLUMN} = NULL WHERE rowid = %s
+        ''', updates)
+        return len(rows), malformed
+
+    migrated = 0
+    skipped = 0
+    while True:
+        converted, malformed = run_transaction(cockroachdb_conn_str, convert_batch)
+        migrated += converted
+        skipped += len(malformed)
+        for rowid in malformed:
+            print(f"Skipped malformed embedding of row {rowid}")
+        if converted:
+            print(f"Migrated {migrated} embeddings ({skipped} malformed)")
+        if converted < batch_size:
+            break
+    return migrated
+
+
+if __name__ == "__main__":
+    DATABASE_PATH = st.secrets["cockroachdb"]["connection_string"]
+    migrate_embeddings(DATABASE_PATH)
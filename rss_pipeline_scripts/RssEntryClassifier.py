@@ -4,67 +4,120 @@ from torch.nn import functional as F
 import torch
 import json
 import psycopg2
+import psycopg2.extras
+from RssDbPool import get_connection
+from RssWorkQueue import WorkQueue
+from RssModelRegistry import register_model, get_model
+from RssEmbeddingCodec import encode_embedding, add_embedding_column, EMBEDDING_COLUMN
 import streamlit as st
 
-tokenizer = AutoTokenizer.from_pretrained("thenlper/gte-small")
-model = AutoModel.from_pretrained("thenlper/gte-small")
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
-
-def classify_titles_from_db(cockroachdb_conn_str, classes, threshold=0.8, increment_func=None):
-    conn = psycopg2.connect(cockroachdb_conn_str)
-    cursor = conn.cursor()
-    # Fetching table names
-    cursor.execute("""
-    SELECT table_name 
-    FROM information_schema.tables 
-    WHERE table_schema = 'public' AND table_name LIKE 'rss_entries';
-    """)
-    tables = [table[0] for table in cursor.fetchall()]
-    class_embeddings = [model(tokenizer.encode(text, return_tensors='pt').to(device))[0].mean(1).squeeze().detach().cpu() for text in classes]
-
-    # classified_count = 0  # Counter to track the number of classified entries
+MODEL_NAME = "thenlper/gte-small"
 
-    for table in tables:
-        cursor.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = %s;", (table,))
-        columns = [column[0] for column in cursor.fetchall()]
-        
-        if 'class' not in columns:
-            cursor.execute(f"ALTER TABLE {table} ADD COLUMN class TEXT;")
-            conn.commit()
-        if 'similarity' not in columns:
-            cursor.execute(f"ALTER TABLE {table} ADD COLUMN similarity REAL;")
-            conn.commit()
-        if 'embedding' not in columns:
-            cursor.execute(f"ALTER TABLE {table} ADD COLUMN embedding TEXT;")
-            conn.commit()
-
-        cursor.execute(f"SELECT rowid, Title FROM {table} WHERE class IS NULL OR class = '';")
-        titles = cursor.fetchall()
+def _load_gte_small():
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = AutoModel.from_pretrained(MODEL_NAME)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model.to(device)
+    model.eval()
+    return tokenizer, model, device
 
+register_model(MODEL_NAME, _load_gte_small)
+
+BATCH_SIZE = 64  # Titles per forward pass
+
+def classify_titles_from_db(cockroachdb_conn_str, classes, threshold=0.8, increment_func=None, batch_size=BATCH_SIZE):
+    with get_connection(cockroachdb_conn_str) as conn:
+        cursor = conn.cursor()
+        # Fetching table names
+        cursor.execute("""
+        SELECT table_name 
+        FROM information_schema.tables 
+        WHERE table_schema = 'public' AND table_name LIKE 'rss_entries';
+        """)
+        tables = [table[0] for table in cursor.fetchall()]
+
+        for table in tables:
+            cursor.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = %s;", (table,))
+            columns = [column[0] for column in cursor.fetchall()]
         
-        
-        for rowid, title in titles:
-            classification, similarity, title_embedding_tensor = get_most_similar_class(title, class_embeddings, classes, threshold)
-            serialized_embedding = json.dumps(title_embedding_tensor.detach().cpu().numpy().tolist())
-            cursor.execute(f"UPDATE {table} SET Class = %s, Similarity = %s, Embedding = %s WHERE rowid = %s", (classification, similarity, serialized_embedding, rowid))
-            
-            if increment_func:
-                increment_func()
-        
-        conn.commit()
-    conn.close()
+            if 'class' not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN class TEXT;")
+                conn.commit()
+            if 'similarity' not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN similarity REAL;")
+                conn.commit()
+            if 'embedding' not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN embedding TEXT;")
+                conn.commit()
+            if EMBEDDING_COLUMN not in columns:
+                add_embedding_column(cursor, table)
+                conn.commit()
+
+    class_matrix = build_class_matrix(classes, batch_size)
+
+    def process_batch(rows):
+        results = classify_titles([title for _, title in rows], class_matrix, classes, threshold, batch_size)
+        return [
+            (classification, similarity, psycopg2.Binary(encode_embedding(title_embedding_tensor)), rowid)
+            for (rowid, _), (classification, similarity, title_embedding_tensor) in zip(rows, results)
+        ]
+
+    classified_count = 0
+    for table in tables:
+        queue = WorkQueue(
+            cockroachdb_conn_str, table, ["Title"],
+            where_clause="class IS NULL OR class = ''",
+            update_query=f"UPDATE {table} SET Class = %s, Similarity = %s, {EMBEDDING_COLUMN} = %s WHERE rowid = %s",
+        )
+        classified_count += queue.run(process_batch, increment_func)
+
+    return classified_count  # Return the total number of classified entries
+
+
+def embed_texts(texts, batch_size=BATCH_SIZE):
+    """Mean-pooled gte-small embeddings for texts, one row per text, computed in padded batches."""
+    tokenizer, model, device = get_model(MODEL_NAME)
+    embeddings = []
+    with torch.no_grad():
+        for start in range(0, len(texts), batch_size):
+            encoded = tokenizer(texts[start:start + batch_size], padding=True, truncation=True, return_tensors='pt').to(device)
+            hidden_states = model(**encoded)[0]
+            # Padding tokens are masked out so every row equals the unpadded single-title embedding
+            mask = encoded['attention_mask'].unsqueeze(-1).to(hidden_states.dtype)
+            pooled = (hidden_states * mask).sum(1) / mask.sum(1).clamp(min=1)
+            embeddings.append(pooled.cpu())
+    if not embeddings:
+        return torch.empty(0, model.config.hidden_size)
+    return torch.cat(embeddings)
+
+def build_class_matrix(classes, batch_size=BATCH_SIZE):
+    """L2-normalized class embeddings, one row per class."""
+    return F.normalize(embed_texts(list(classes), batch_size), dim=1)
+
+def classify_titles(titles, class_matrix, classes, threshold, batch_size=BATCH_SIZE):
+    """
+    Classify many titles at once. Returns (classification, similarity, embedding)
+    per title, the same as get_most_similar_class does for one title.
+    """
+    results = [("None", 0, torch.tensor([]))] * len(titles)
+    valid = [i for i, title in enumerate(titles) if title and isinstance(title, str)]
+    if not valid:
+        return results
+
+    title_embeddings = embed_texts([titles[i] for i in valid], batch_size)
+    # Cosine similarity against every class in a single matrix multiply
+    similarities = F.normalize(title_embeddings, dim=1) @ class_matrix.T
+    max_similarities, best_classes = similarities.max(dim=1)
 
-    # return classified_count  # Return the total number of classified entries
+    for row, i in enumerate(valid):
+        max_similarity = max_similarities[row].item()
+        classification = "None" if max_similarity < threshold else classes[best_classes[row].item()]
+        results[i] = (classification, round(max_similarity, 2), title_embeddings[row])
+    return results
 
 def get_most_similar_class(title, class_embeddings, classes, threshold):
-    if not title or not isinstance(title, str):
-        return "None", 0, torch.tensor([])
-    title_embedding_tensor = model(tokenizer.encode(title, return_tensors='pt').to(device))[0].mean(1).squeeze()
-    similarities = [F.cosine_similarity(title_embedding_tensor, class_emb, dim=0).item() for class_emb in class_embeddings]
-    max_similarity = max(similarities)
-    classification = "None" if max_similarity < threshold else classes[similarities.index(max_similarity)]
-    return classification, round(max_similarity, 2), title_embedding_tensor
+    class_matrix = class_embeddings if torch.is_tensor(class_embeddings) else F.normalize(torch.stack(list(class_embeddings)), dim=1)
+    return classify_titles([title], class_matrix, classes, threshold)[0]
 
 
 # DEFAULT_CLASSES = ["News", "Entertainment", "Sports", "Economy", "Technology", "Science", "Stock Market", "Reviews", "Business", "Finance", "Politics"]
@@ -3,12 +3,21 @@ import psycopg2
 import datetime
 import threading
 import time
+import asyncio
+import aiohttp
+import hashlib
+import psycopg2.extras
+from urllib.parse import urlparse
 from tenacity import RetryError
 import streamlit as st
 import feedparser
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from tenacity import retry, stop_after_attempt, wait_fixed
 from concurrent.futures import ThreadPoolExecutor
+from RssDbPool import get_connection, run_transaction
+from RssSchemaMigration import add_entry_columns
+from RssDateParser import entry_datetime
+from RssFeedScheduler import fetch_due_links, record_poll_results, CHANGED, UNCHANGED, FAILED
 
 
 class RSSReader:
@@ -18,21 +27,57 @@ class RSSReader:
         self.days_to_crawl = days_to_crawl
 
     def _get_rss_links(self):
-        with psycopg2.connect(self.database) as conn:
+        with get_connection(self.database) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT link FROM rss_links")
             return [row[0] for row in cursor.fetchall()]
 
-    def _load_existing_entries(self, table_name):
-        with psycopg2.connect(self.database) as conn:
+    def _load_feed_cache(self, rss_links):
+        """Return {link: (etag, last_modified, content_hash)} for the given links."""
+        with get_connection(self.database) as conn:
             cursor = conn.cursor()
-            cursor.execute(f"SELECT publisher, title, link, published, language FROM {table_name}")
-            return set(cursor.fetchall())
-        
+            cursor.execute("SELECT link, etag, last_modified, content_hash FROM rss_links WHERE link = ANY(%s)", (list(rss_links),))
+            return {row[0]: row[1:] for row in cursor.fetchall()}
+
+    def _save_feed_cache(self, cache_updates):
+        """
+        Store (link, etag, last_modified, content_hash) tuples in one statement.
+        A content_hash of None keeps the stored hash (the threaded path does not hash bodies).
+        """
+        if not cache_updates:
+            return
+
+        def update(conn):
+            cursor = conn.cursor()
+            psycopg2.extras.execute_values(cursor, '''
+            UPDATE rss_links SET etag = v.etag, last_modified = v.last_modified,
+                content_hash = COALESCE(v.content_hash, rss_links.content_hash)
+            FROM (VALUES %s) AS v(link, etag, last_modified, content_hash)
+            WHERE rss_links.link = v.link
+            ''', cache_updates, template="(%s, %s::STRING, %s::STRING, %s::STRING)")
+
+        run_transaction(self.database, update)
+
     @retry(stop=stop_after_attempt(1), wait=wait_fixed(20))
     def _fetch_rss_entries(self, rss_link):
-        feed = feedparser.parse(rss_link)
-        
+        """
+        Return (entries, new validators row or None); the validators are saved by the caller.
+        entries is None if the feed did not change since the last run.
+        """
+        etag, last_modified, _ = self._load_feed_cache([rss_link]).get(rss_link, (None, None, None))
+        feed = feedparser.parse(rss_link, etag=etag, modified=last_modified)
+
+        # Feed did not change since the last run
+        if feed.get("status") == 304:
+            return None, None
+
+        cache_update = None
+        if feed.get("etag") or feed.get("modified"):
+            cache_update = (rss_link, feed.get("etag"), feed.get("modified"), None)
+
+        return self._entries_from_feed(feed, rss_link), cache_update
+
+    def _entries_from_feed(self, feed, rss_link):
         # Check if feedparser output is empty or erroneous
         if not feed.entries:
             print(f"Error fetching or empty content for RSS link: {rss_link}. Marking as dead.")
@@ -40,7 +85,7 @@ class RSSReader:
             return set()
 
         current_entries = set()
-        cutoff_date = datetime.now() - timedelta(days=self.days_to_crawl)
+        cutoff_date = datetime.now(timezone.utc) - timedelta(days=self.days_to_crawl)
         publisher_name = feed.feed.title if hasattr(feed.feed, 'title') else "Unknown Publisher"
         language = feed.feed.language if hasattr(feed.feed, 'language') else "Unknown Language" 
 
@@ -48,14 +93,12 @@ class RSSReader:
             try:
                 title = entry.title if hasattr(entry, 'title') else ""
                 link = entry.link if hasattr(entry, 'link') else ""
-                published = entry.published if hasattr(entry, 'published') else ""
-
-                try:
-                    pub_date = datetime.strptime(published, '%a, %d %b %Y %H:%M:%S %Z')
-                    if pub_date >= cutoff_date:
-                        current_entries.add((publisher_name, title, link, published, language))
-                except ValueError:
-                    pass
+                published = entry.get('published') or entry.get('updated') or ""
+
+                # Entries without any recognizable date are skipped
+                pub_date = entry_datetime(entry, feed_key=rss_link)
+                if pub_date is not None and pub_date >= cutoff_date:
+                    current_entries.add((publisher_name, title, link, published, language, pub_date))
             except Exception as e:
                 print(f"Error processing entry for RSS link {rss_link}: {e}")
                 pass
@@ -64,22 +107,27 @@ class RSSReader:
 
 
     def _save_to_db(self, entries, table_name):
-        with psycopg2.connect(self.database) as conn:
+        """Insert all entries in one statement and transaction, return how many rows were new."""
+        entries = list(entries)
+        if not entries:
+            return 0
+
+        def insert(conn):
             cursor = conn.cursor()
-            for entry in entries:
-                try:
-                    cursor.execute(f'''
-                    INSERT INTO {table_name} (publisher, title, link, published, language)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ''', entry)
-                except psycopg2.IntegrityError:  # Link already exists
-                    conn.rollback()  # Rollback transaction on error
-                else:
-                    conn.commit()  # Commit transaction if no errors
+            # Links that already exist are skipped by the unique constraint
+            inserted = psycopg2.extras.execute_values(cursor, f'''
+            INSERT INTO {table_name} (publisher, title, link, published, language, published_at)
+            VALUES %s
+            ON CONFLICT (link) DO NOTHING
+            RETURNING link
+            ''', entries, page_size=WRITE_BATCH_SIZE, fetch=True)
+            return len(inserted)
+
+        return run_transaction(self.database, insert)
 
     def create_table_for_run(self):
         table_name = "rss_entries"  # Using a fixed table name
-        with psycopg2.connect(self.database) as conn:
+        with get_connection(self.database) as conn:
             cursor = conn.cursor()
             cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS {table_name} (
@@ -87,21 +135,182 @@ class RSSReader:
                 title TEXT NOT NULL,
                 link TEXT UNIQUE NOT NULL,
                 published TEXT NOT NULL,
-                language TEXT NOT NULL
+                language TEXT NOT NULL,
+                published_at TIMESTAMPTZ,
+                inserted_at TIMESTAMPTZ DEFAULT now(),
+                id UUID NOT NULL DEFAULT gen_random_uuid()
             )
             ''')
+            # Tables created before the typed columns existed
+            add_entry_columns(cursor, table_name)
         return table_name
 
     def start(self, rss_links):
+        """Fetch and store rss_links, return the number of new entries. Fills poll_results for RssFeedScheduler."""
         table_name = self.create_table_for_run()
+        new_count = 0
+        self.poll_results = {}
 
         for rss_link in rss_links:
-            current_entries = self._fetch_rss_entries(rss_link)
-            existing_entries = self._load_existing_entries(table_name)
-            new_entries = current_entries - existing_entries
+            current_entries, cache_update = self._fetch_rss_entries(rss_link)
+            if current_entries is None:
+                self.poll_results[rss_link] = (UNCHANGED, 0)
+                continue
+            new_count += self._store_entries(current_entries, table_name)
+            self.poll_results[rss_link] = (CHANGED, len(current_entries))
+            # Only remember the validators once the entries are stored, a failed
+            # insert must not turn the next run into a 304 that skips them
+            if cache_update is not None:
+                self._save_feed_cache([cache_update])
+
+        return new_count
+
+    def _store_entries(self, current_entries, table_name):
+        """Save the entries that are not in the table yet, return how many were new."""
+        # One entry per link (link is UNIQUE in the table), the insert skips the stored ones
+        entries_by_link = {entry[2]: entry for entry in current_entries}
+        return self._save_to_db(entries_by_link.values(), table_name)
+
+
+class AsyncRSSReader:
+    """
+    Fetches feeds concurrently on one event loop with a shared HTTP client.
+
+    Downloads are capped globally (max_in_flight) and per host (per_host_limit),
+    and a download that exceeds the timeout is cancelled before it is retried,
+    so slow feeds never leave threads behind.
+    """
 
-            if new_entries:
-                self._save_to_db(new_entries, table_name)
+    def __init__(self, database, days_to_crawl=1, max_in_flight=100, per_host_limit=4,
+                 timeout=30, max_attempts=3, write_batch_size=None):
+        self.reader = RSSReader(database, days_to_crawl=days_to_crawl)
+        self.write_batch_size = write_batch_size or WRITE_BATCH_SIZE
+        self.max_in_flight = max_in_flight
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self._host_semaphores = {}
+
+    def _host_semaphore(self, rss_link):
+        host = urlparse(rss_link).netloc.lower()
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    async def _download(self, session, rss_link, request_headers):
+        async with session.get(rss_link, headers=request_headers) as response:
+            content = await response.read()
+            return response.status, dict(response.headers), content
+
+    async def _fetch_feed(self, session, rss_link):
+        """Download a feed with per-host limits, cancelling and retrying on timeout."""
+        etag, last_modified, _ = self._feed_cache.get(rss_link, (None, None, None))
+        request_headers = {}
+        if etag:
+            request_headers["If-None-Match"] = etag
+        if last_modified:
+            request_headers["If-Modified-Since"] = last_modified
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with self._host_semaphore(rss_link), self._in_flight:
+                    return await asyncio.wait_for(self._download(session, rss_link, request_headers), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                print(f"Fetching RSS from {rss_link} took too long, retry {attempt} of {self.max_attempts}.")
+            except (aiohttp.ClientError, ValueError) as e:
+                print(f"Error fetching RSS link {rss_link}: {e}")
+                return None
+        return None
+
+    async def _process_link(self, session, rss_link, table_name):
+        loop = asyncio.get_running_loop()
+        result = await self._fetch_feed(session, rss_link)
+
+        cache_update = self._cache_update(rss_link, *result) if result is not None else None
+        if result is None:
+            self.poll_results[rss_link] = (FAILED, 0)
+        elif cache_update is None:
+            self.poll_results[rss_link] = (UNCHANGED, 0)
+        else:
+            status, headers, content = result
+            feed = await loop.run_in_executor(None, lambda: feedparser.parse(content, response_headers=headers))
+            current_entries = await loop.run_in_executor(None, self.reader._entries_from_feed, feed, rss_link)
+            self._pending_entries.extend(current_entries)
+            self.poll_results[rss_link] = (CHANGED, len(current_entries)) if status < 400 else (FAILED, 0)
+            if status == 200:
+                self._pending_cache_updates.append(cache_update)
+
+            if len(self._pending_entries) >= self.write_batch_size:
+                await self._flush(table_name)
+
+        with entries_lock:
+            RSS_READER_STATUS["rss_feeds_crawled"] += 1
+
+    async def _flush(self, table_name):
+        """Write the buffered entries of many feeds in one transaction."""
+        entries, self._pending_entries = self._pending_entries, []
+        cache_updates, self._pending_cache_updates = self._pending_cache_updates, []
+
+        inserted = await asyncio.get_running_loop().run_in_executor(None, self.reader._store_entries, entries, table_name)
+        # Only remember the validators once the entries are stored
+        self._cache_updates.extend(cache_updates)
+        self.inserted_count += inserted
+
+        with entries_lock:
+            RSS_READER_STATUS["entries_crawled"] += inserted
+
+    def _cache_update(self, rss_link, status, headers, content):
+        """
+        Return the new (link, etag, last_modified, content_hash) row for a downloaded
+        feed, or None if it has not changed (304 or same body hash) and needs no parsing.
+        """
+        if status == 304:
+            self.not_modified_count += 1
+            return None
+
+        content_hash = hashlib.sha256(content).hexdigest()
+        if status == 200 and self._feed_cache.get(rss_link, (None, None, None))[2] == content_hash:
+            self.unchanged_hash_count += 1
+            return None
+
+        return (rss_link, headers.get("ETag"), headers.get("Last-Modified"), content_hash)
+
+    async def _run(self, rss_links):
+        loop = asyncio.get_running_loop()
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._host_semaphores = {}
+        self._cache_updates = []
+        self._pending_entries = []
+        self._pending_cache_updates = []
+        self.inserted_count = 0
+        self.not_modified_count = 0
+        self.unchanged_hash_count = 0
+        self.poll_results = {}
+        table_name = await loop.run_in_executor(None, self.reader.create_table_for_run)
+        self._feed_cache = await loop.run_in_executor(None, self.reader._load_feed_cache, rss_links)
+
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight, limit_per_host=self.per_host_limit)
+        async with aiohttp.ClientSession(connector=connector, headers={"User-Agent": USER_AGENT}) as session:
+            results = await asyncio.gather(
+                *(self._process_link(session, rss_link, table_name) for rss_link in rss_links),
+                return_exceptions=True
+            )
+
+        for rss_link, result in zip(rss_links, results):
+            if isinstance(result, Exception):
+                print(f"Error: Failed to process RSS link {rss_link}: {result}")
+                self.poll_results[rss_link] = (FAILED, 0)
+
+        await self._flush(table_name)
+        await loop.run_in_executor(None, self.reader._save_feed_cache, self._cache_updates)
+        await loop.run_in_executor(None, record_poll_results, self.reader.database, self.poll_results, self.reader.days_to_crawl * 24)
+        print(f"Feeds not modified: {self.not_modified_count}, unchanged content: {self.unchanged_hash_count}")
+        print(f"New entries inserted: {self.inserted_count}")
+        return self.inserted_count
+
+    def start(self, rss_links):
+        """Fetch and store all rss_links, return the number of new entries."""
+        return asyncio.run(self._run(list(rss_links)))
 
 
 
@@ -110,6 +319,13 @@ CHUNK_SIZE = 5  # Adjust as needed
 DAYS_TO_CRAWL = 1  # Adjust as needed
 LINKS_CRAWLED = 0
 
+READER_MODE = "async"  # "async" or "threaded"
+SCHEDULED_POLLING = True  # Only poll the feeds RssFeedScheduler marks as due
+MAX_IN_FLIGHT = 100  # Global cap on concurrent feed downloads in async mode
+PER_HOST_LIMIT = 4  # Concurrent downloads per host in async mode
+WRITE_BATCH_SIZE = 500  # Entries written per INSERT / transaction
+USER_AGENT = "Mozilla/5.0 (compatible; RssAnalyser/1.0)"
+
 RSS_READER_STATUS = {
     "status": "idle",
     "entries_crawled": 0,
@@ -121,15 +337,20 @@ RSS_READER_STATUS = {
 
 entries_lock = threading.Lock()  # Lock for thread-safe updates
 links_lock = threading.Lock()
+POLL_RESULTS = {}  # link -> (outcome, entry count) of the threaded reader, for RssFeedScheduler
 
-def fetch_rss_links_from_db(chunk_size=CHUNK_SIZE):
-    """Fetch RSS links from the database and split them into chunks."""
+def fetch_rss_links_from_db(chunk_size=CHUNK_SIZE, due_only=SCHEDULED_POLLING):
+    """Fetch RSS links (all live ones, or only the due ones in priority order) and split them into chunks."""
     add_dead_link_column()
+    add_feed_cache_columns()
     try:
-        with psycopg2.connect(DATABASE_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT link FROM rss_links WHERE dead_link = FALSE")
-            all_links = [row[0] for row in cursor.fetchall()]
+        if due_only:
+            all_links = fetch_due_links(DATABASE_PATH)
+        else:
+            with get_connection(DATABASE_PATH) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT link FROM rss_links WHERE dead_link = FALSE")
+                all_links = [row[0] for row in cursor.fetchall()]
     except psycopg2.Error as e:
         print(f"Database error: {e}")
         return []
@@ -139,19 +360,27 @@ def fetch_rss_links_from_db(chunk_size=CHUNK_SIZE):
         yield all_links[i:i + chunk_size]
 
 def mark_link_as_dead(rss_link):
-    with psycopg2.connect(DATABASE_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE rss_links SET dead_link = TRUE WHERE link = %s", (rss_link,))
-        conn.commit()
+    run_transaction(DATABASE_PATH, lambda conn: conn.cursor().execute("UPDATE rss_links SET dead_link = TRUE WHERE link = %s", (rss_link,)))
 
 def add_dead_link_column():
-    with psycopg2.connect(DATABASE_PATH) as conn:
+    with get_connection(DATABASE_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute('''
         ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS dead_link BOOLEAN DEFAULT FALSE;
         ''')
         conn.commit()
 
+def add_feed_cache_columns():
+    """Columns holding the conditional GET validators of every feed."""
+    with get_connection(DATABASE_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS etag TEXT;
+        ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS last_modified TEXT;
+        ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS content_hash TEXT;
+        ''')
+        conn.commit()
+
 def fetch_single_rss_link(rss_link, done_event):
     """
     Fetch a single RSS link using the RSSReader.
@@ -168,10 +397,13 @@ def fetch_single_rss_link(rss_link, done_event):
 
 TIMEOUT_DURATION = 30  # Increase the timeout duration to 60 seconds
 
-def fetch_single_rss_link(rss_link, done_event):
+def fetch_single_rss_link(rss_link, done_event, result=None):
     try:
         reader = RSSReader(DATABASE_PATH, days_to_crawl=DAYS_TO_CRAWL)
-        reader.start([rss_link])
+        new_count = reader.start([rss_link])
+        if result is not None:
+            result["new_entries"] = new_count
+            result["poll_result"] = reader.poll_results[rss_link]
     except Exception as e:
         print(f"Error: Failed to fetch content from RSS link {rss_link}: {e}")
     finally:
@@ -187,7 +419,9 @@ def fetch_rss_data_chunk(rss_links_chunk):
 
         while attempts < max_attempts:
             done_event = threading.Event()
-            rss_thread = threading.Thread(target=fetch_single_rss_link, args=(rss_link, done_event), daemon=True)
+            # Stays FAILED unless the fetch completes
+            result = {"new_entries": 0, "poll_result": (FAILED, 0)}
+            rss_thread = threading.Thread(target=fetch_single_rss_link, args=(rss_link, done_event, result), daemon=True)
             rss_thread.start()
 
             done_event.wait(timeout=TIMEOUT_DURATION)
@@ -195,17 +429,14 @@ def fetch_rss_data_chunk(rss_links_chunk):
             if not done_event.is_set():
                 print(f"Fetching RSS from {rss_link} took too long, retrying.")
                 attempts += 1
+                POLL_RESULTS[rss_link] = (FAILED, 0)
                 continue
 
             try:
-                with psycopg2.connect(DATABASE_PATH) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(f"SELECT COUNT(*) FROM rss_entries")
-                    count = cursor.fetchone()[0]
-
-                    with entries_lock:  # Ensuring thread-safe updates
-                        RSS_READER_STATUS["entries_crawled"] += count
-                        RSS_READER_STATUS["rss_feeds_crawled"] += 1
+                with entries_lock:  # Ensuring thread-safe updates
+                    RSS_READER_STATUS["entries_crawled"] += result["new_entries"]
+                    RSS_READER_STATUS["rss_feeds_crawled"] += 1
+                    POLL_RESULTS[rss_link] = result["poll_result"]
                 break
 
             except psycopg2.OperationalError as e:
@@ -227,16 +458,25 @@ def fetch_rss_data_chunk(rss_links_chunk):
     return "success"
 
 
-def run_rss_reader():
+def run_rss_reader(mode=READER_MODE, due_only=SCHEDULED_POLLING):
     global RSS_READER_STATUS
 
     RSS_READER_STATUS["start_time"] = time.time()
-
-    chunks = list(fetch_rss_links_from_db())
-    
-    # Use ThreadPoolExecutor to run fetch_rss_data_chunk in multiple threads
-    with ThreadPoolExecutor() as executor:
-        executor.map(fetch_rss_data_chunk, chunks)
+    RSS_READER_STATUS["status"] = "running"
+
+    chunks = list(fetch_rss_links_from_db(due_only=due_only))
+
+    if mode == "async":
+        rss_links = [rss_link for chunk in chunks for rss_link in chunk]
+        reader = AsyncRSSReader(DATABASE_PATH, days_to_crawl=DAYS_TO_CRAWL, max_in_flight=MAX_IN_FLIGHT,
+                                per_host_limit=PER_HOST_LIMIT, timeout=TIMEOUT_DURATION)
+        reader.start(rss_links)
+    else:
+        # Use ThreadPoolExecutor to run fetch_rss_data_chunk in multiple threads
+        POLL_RESULTS.clear()
+        with ThreadPoolExecutor() as executor:
+            executor.map(fetch_rss_data_chunk, chunks)
+        record_poll_results(DATABASE_PATH, POLL_RESULTS, DAYS_TO_CRAWL * 24)
 
     end_time = time.time()
     RSS_READER_STATUS["runtime"] = end_time - RSS_READER_STATUS["start_time"]
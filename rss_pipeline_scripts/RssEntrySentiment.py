@@ -1,58 +1,67 @@
 from transformers import pipeline
 import psycopg2
+from RssDbPool import get_connection
+from RssWorkQueue import WorkQueue
+from RssModelRegistry import register_model, get_model
 import streamlit as st
 
 MODEL = st.secrets["sentimentModel"]['sentiment_model']
 
-sentiment_analysis = pipeline("sentiment-analysis", model=MODEL)
+register_model(MODEL, lambda: pipeline("sentiment-analysis", model=MODEL))
 
 def classify_sentiments_in_db(cockroachdb_conn_str, classes_list=None, increment_func=None):
-    conn = psycopg2.connect(cockroachdb_conn_str)
-    cursor = conn.cursor()
+    with get_connection(cockroachdb_conn_str) as conn:
+        cursor = conn.cursor()
     
-    # Fetching table names
-    cursor.execute("""
-    SELECT table_name 
-    FROM information_schema.tables 
-    WHERE table_schema = 'public' AND table_name LIKE 'rss_entries';
-    """)
-    tables = [table[0] for table in cursor.fetchall()]
+        # Fetching table names
+        cursor.execute("""
+        SELECT table_name 
+        FROM information_schema.tables 
+        WHERE table_schema = 'public' AND table_name LIKE 'rss_entries';
+        """)
+        tables = [table[0] for table in cursor.fetchall()]
     
-    for table in tables:
-        # Fetch columns for the current table
-        cursor.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = %s;", (table,))
-        columns = [column[0] for column in cursor.fetchall()]
-        
-        # Check and add 'Sentiment' column if it doesn't exist
-        if 'sentiment' not in columns:
-            cursor.execute(f"ALTER TABLE {table} ADD COLUMN sentiment TEXT;")
-            conn.commit()
-        if classes_list:
-            placeholders = ', '.join(['%s' for _ in classes_list])
-            cursor.execute(f"SELECT rowid, Title FROM {table} WHERE (class IN ({placeholders})) AND (sentiment IS NULL OR sentiment = '');", classes_list)
-        else:
-            cursor.execute(f"SELECT rowid, Title FROM {table} WHERE sentiment IS NULL OR sentiment = '';")
+        for table in tables:
+            # Fetch columns for the current table
+            cursor.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = %s;", (table,))
+            columns = [column[0] for column in cursor.fetchall()]
         
-        titles = cursor.fetchall()
+            # Check and add 'Sentiment' column if it doesn't exist
+            if 'sentiment' not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN sentiment TEXT;")
+                conn.commit()
+
+    where_clauses = ["sentiment IS NULL OR sentiment = ''"]
+    params = []
+    if classes_list:
+        where_clauses.insert(0, "class = ANY(%s)")
+        params.append(list(classes_list))
+    where_clause = " AND ".join(f"({clause})" for clause in where_clauses)
 
-        for row_id, title in titles:
+    def process_batch(rows):
+        updates = []
+        for row_id, title in rows:
             try:
                 sentiment = analyze_sentiment(title)
             except Exception as e:
                 print(f"Error during classification of title '{title}': {e}")
                 sentiment = 'Unknown'
-            
-            cursor.execute(f"UPDATE {table} SET sentiment = %s WHERE rowid = %s", (sentiment, row_id))
+            updates.append((sentiment, row_id))
+        return updates
 
-            if increment_func:
-                increment_func()
-        
-        conn.commit()
-    conn.close()
+    for table in tables:
+        queue = WorkQueue(
+            cockroachdb_conn_str, table, ["Title"],
+            where_clause=where_clause,
+            update_query=f"UPDATE {table} SET sentiment = %s WHERE rowid = %s",
+            params=params,
+        )
+        queue.run(process_batch, increment_func)
 
 def analyze_sentiment(title):
     if not title or not isinstance(title, str):
         return 'Unknown'
+    sentiment_analysis = get_model(MODEL)
     return str(sentiment_analysis(title)[0]["label"])
 
 # # DEFAULT_CLASSES = ["News", "Entertainment", "Sports", "Economy", "Technology", "Science", "Stock Market", "Reviews", "Business", "Finance", "Politics"]
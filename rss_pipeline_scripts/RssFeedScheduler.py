@@ -0,0 +1,128 @@
+import json
+from datetime import datetime, timedelta, timezone
+import psycopg2.extras
+import streamlit as st
+from RssDbPool import get_connection, run_transaction
+
+# Decides which feeds the reader polls in a run. Every feed keeps its observed
+# entry rate, last change and failure count in rss_links; after each poll the
+# next due time is derived from them, so feeds that post every few minutes are
+# read every run while feeds that rarely change back off up to MAX_POLL_INTERVAL.
+# The reader only keeps entries published within its crawl window, so no interval
+# may exceed that window minus one run, or a feed's entries age out unread.
+
+MIN_POLL_INTERVAL = 3600  # Seconds, the pipeline runs hourly
+MAX_POLL_INTERVAL = 7 * 24 * 3600
+DUE_SLACK = 300  # Feeds due within this many seconds are polled now instead of one run later
+TARGET_ENTRIES_PER_POLL = 3  # Poll often enough to see about this many new entries each time
+RATE_SMOOTHING = 0.5  # Weight of the newest observation in the entry rate average
+
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+
+
+def add_schedule_columns(cursor):
+    cursor.execute('''
+    ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS next_due_at TIMESTAMPTZ;
+    ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS poll_interval INT8;
+    ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS last_polled_at TIMESTAMPTZ;
+    ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS last_changed_at TIMESTAMPTZ;
+    ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS entry_rate FLOAT8;
+    ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS failure_count INT8 DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS rss_links_next_due_at_idx ON rss_links (next_due_at);
+    ''')
+
+
+def fetch_due_links(database, limit=None):
+    """Live links that are due, never-polled feeds first, then by entry rate."""
+    with get_connection(database) as conn:
+        cursor = conn.cursor()
+        add_schedule_columns(cursor)
+        conn.commit()
+        cursor.execute(f'''
+        SELECT link FROM rss_links
+        WHERE dead_link = FALSE AND (next_due_at IS NULL OR next_due_at <= now() + INTERVAL '{DUE_SLACK} seconds')
+        ORDER BY next_due_at IS NOT NULL, entry_rate DESC NULLS LAST, next_due_at
+        {"LIMIT %s" if limit else ""}
+        ''', (limit,) if limit else None)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def longest_interval(window_hours):
+    """Longest poll interval in seconds that still sees every entry of a window_hours crawl window."""
+    return max(MIN_POLL_INTERVAL, min(MAX_POLL_INTERVAL, window_hours * 3600 - MIN_POLL_INTERVAL))
+
+
+def next_schedule(state, outcome, entries_in_window, window_hours, now):
+    """
+    Compute the new (poll_interval, entry_rate, failure_count, last_changed_at, next_due_at)
+    of a feed from its stored state (poll_interval, entry_rate, failure_count, last_changed_at)
+    and the outcome of this poll. window_hours is the reader's crawl window, it caps the interval.
+    """
+    interval, rate, failures, last_changed_at = state
+    interval = interval or MIN_POLL_INTERVAL
+    failures = failures or 0
+    max_interval = longest_interval(window_hours)
+
+    if outcome == FAILED:
+        failures += 1
+        interval = min(max_interval, MIN_POLL_INTERVAL * 2 ** failures)
+    elif outcome == UNCHANGED:
+        failures = 0
+        interval = min(max_interval, interval * 2)
+    else:
+        failures = 0
+        last_changed_at = now
+        observed_rate = entries_in_window / window_hours
+        rate = observed_rate if rate is None else RATE_SMOOTHING * observed_rate + (1 - RATE_SMOOTHING) * rate
+        if rate > 0:
+            interval = TARGET_ENTRIES_PER_POLL / rate * 3600
+        else:
+            interval = interval * 2
+        interval = min(max_interval, max(MIN_POLL_INTERVAL, interval))
+
+    interval = int(interval)
+    return interval, rate, failures, last_changed_at, now + timedelta(seconds=interval)
+
+
+def record_poll_results(database, results, window_hours):
+    """
+    Store the schedule of every polled feed. results maps link to
+    (outcome, number of entries published within the last window_hours).
+    """
+    if not results:
+        return
+
+    with get_connection(database) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT link, poll_interval, entry_rate, failure_count, last_changed_at FROM rss_links WHERE link = ANY(%s)
+        ''', (list(results),))
+        states = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    now = datetime.now(timezone.utc)
+    updates = []
+    for link, (outcome, entries_in_window) in results.items():
+        state = states.get(link, (None, None, 0, None))
+        interval, rate, failures, last_changed_at, next_due_at = next_schedule(state, outcome, entries_in_window, window_hours, now)
+        updates.append((link, interval, rate, failures, last_changed_at, next_due_at, now))
+
+    def update(conn):
+        psycopg2.extras.execute_values(conn.cursor(), '''
+        UPDATE rss_links SET poll_interval = v.poll_interval, entry_rate = v.entry_rate, failure_count = v.failure_count,
+            last_changed_at = v.last_changed_at, next_due_at = v.next_due_at, last_polled_at = v.last_polled_at
+        FROM (VALUES %s) AS v(link, poll_interval, entry_rate, failure_count, last_changed_at, next_due_at, last_polled_at)
+        WHERE rss_links.link = v.link
+        ''', updates, template="(%s, %s::INT8, %s::FLOAT8, %s::INT8, %s::TIMESTAMPTZ, %s::TIMESTAMPTZ, %s::TIMESTAMPTZ)", page_size=1000)
+
+    run_transaction(database, update)
+    counts = {outcome: sum(1 for o, _ in results.values() if o == outcome) for outcome in (CHANGED, UNCHANGED, FAILED)}
+    print(f"Scheduled {len(updates)} feeds: {counts[CHANGED]} changed, {counts[UNCHANGED]} unchanged, {counts[FAILED]} failed")
+
+
+if __name__ == "__main__":
+    DATABASE_PATH = st.secrets["cockroachdb"]["connection_string"]
+    due_links = fetch_due_links(DATABASE_PATH)
+    print(json.dumps(due_links[:20], indent=2))
+    print(f"{len(due_links)} feeds due")
@@ -0,0 +1,223 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import psycopg2.extras
+import requests
+import streamlit as st
+from lxml import etree
+from RssDbPool import get_connection, run_transaction
+from RssRateLimiter import DomainLimiter
+from RssUrlCanonicalizer import insert_links
+
+# Checks candidate links found by the website crawler before they reach rss_links.
+# Every candidate is probed with a ranged GET: feeds are recognized by their root
+# element (rss, feed, rdf:RDF), HTML pages are searched for <link rel="alternate">
+# feed autodiscovery. Only the final (redirected) URL of a verified feed is stored.
+
+VALIDATION_WORKERS = 32
+VALIDATION_PER_DOMAIN_LIMIT = 4
+VALIDATION_PER_DOMAIN_INTERVAL = 0.1
+PROBE_BYTES = 65536  # Enough for the root element and the <head> of a page
+PROBE_TIMEOUT = 10
+RECHECK_DAYS = 30  # Rejected candidates are probed again after this many days
+CANDIDATES_TABLE_NAME = "feed_candidates"
+USER_AGENT = "Mozilla/5.0 (compatible; RssAnalyser/1.0)"
+
+FEED_ROOT_ELEMENTS = {"rss", "feed", "rdf"}
+FEED_CONTENT_TYPES = ("application/rss+xml", "application/atom+xml", "application/rdf+xml")
+ROOT_ELEMENT_PATTERN = re.compile(rb'<([A-Za-z][\w.\-]*(?::[\w.\-]+)?)[\s/>]')
+SKIPPED_MARKUP_PATTERN = re.compile(rb'<\?.*?\?>|<!--.*?-->|<!DOCTYPE[^>]*>', re.S | re.I)
+
+
+class _AlternateLinkTarget:
+    """lxml parser target collecting the href of <link rel="alternate"> tags with a feed type."""
+
+    def __init__(self):
+        self.hrefs = []
+
+    def start(self, tag, attrib):
+        if tag == "link" and "alternate" in attrib.get("rel", "").lower().split():
+            if attrib.get("type", "").lower() in FEED_CONTENT_TYPES and attrib.get("href"):
+                self.hrefs.append(attrib["href"])
+
+    def close(self):
+        return self.hrefs
+
+
+def root_element(head):
+    """Local name of the first element in the first bytes of a document, None if there is none."""
+    head = head.lstrip().removeprefix(b"\xef\xbb\xbf").lstrip()
+    match = ROOT_ELEMENT_PATTERN.search(SKIPPED_MARKUP_PATTERN.sub(b"", head))
+    if not match:
+        return None
+    return match.group(1).decode("ascii", "replace").split(":")[-1].lower()
+
+
+def alternate_feed_links(html, base_url):
+    target = _AlternateLinkTarget()
+    parser = etree.HTMLParser(target=target, recover=True)
+    try:
+        parser.feed(html)
+        parser.close()
+    except (etree.LxmlError, ValueError):
+        pass
+    return [urljoin(base_url, href) for href in target.hrefs]
+
+
+class FeedValidator:
+
+    def __init__(self, max_workers=VALIDATION_WORKERS, per_domain_limit=VALIDATION_PER_DOMAIN_LIMIT,
+                 per_domain_interval=VALIDATION_PER_DOMAIN_INTERVAL):
+        self.max_workers = max_workers
+        self.domains = DomainLimiter(per_domain_limit, per_domain_interval)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._stats_lock = threading.Lock()
+        self.stats = {"feeds": 0, "discovered": 0, "rejected": 0, "failed": 0}
+        self.unreachable = set()  # Candidates that could not be probed, so nothing is known about them
+
+    def _count(self, outcome, url):
+        with self._stats_lock:
+            self.stats[outcome] += 1
+            if outcome == "discovered":
+                self.stats["feeds"] += 1
+            elif outcome == "failed":
+                self.unreachable.add(url)
+
+    def _probe(self, url):
+        """Return (final url, content type, first PROBE_BYTES bytes) of url."""
+        with self.domains.limit(url):
+            response = self.session.get(url, headers={"Range": f"bytes=0-{PROBE_BYTES - 1}"},
+                                        timeout=PROBE_TIMEOUT, stream=True)
+            try:
+                if response.status_code not in (200, 206):
+                    return response.url, None, None
+                head = b""
+                for chunk in response.iter_content(chunk_size=16384):
+                    head += chunk
+                    if len(head) >= PROBE_BYTES:
+                        break
+                return response.url, response.headers.get("Content-Type", "").lower(), head[:PROBE_BYTES]
+            finally:
+                response.close()
+
+    def _check(self, url, discover=True):
+        """
+        Return (outcome, verified feed URL or None) for url. The outcome is "feeds",
+        "discovered" (through <link rel="alternate">), "rejected" or "failed" (unreachable).
+        """
+        try:
+            final_url, content_type, head = self._probe(url)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Could not probe {url}: {e}")
+            return "failed", None
+
+        if head is None:
+            return "rejected", None
+
+        if root_element(head) in FEED_ROOT_ELEMENTS:
+            return "feeds", final_url
+
+        # An HTML page may announce its feed in <head>
+        outcome = "rejected"
+        if discover and ("html" in (content_type or "") or root_element(head) == "html"):
+            for feed_url in alternate_feed_links(head.decode("utf-8", "replace"), final_url):
+                feed_outcome, verified = self._check(feed_url, discover=False)
+                if verified:
+                    return "discovered", verified
+                if feed_outcome == "failed":
+                    # Nothing is known about the announced feed, so the candidate is tried again later
+                    outcome = "failed"
+        return outcome, None
+
+    def validate(self, url):
+        """Return the verified feed URL for a candidate (itself, its redirect target or an autodiscovered feed), else None."""
+        outcome, feed_url = self._check(url)
+        # Counted once per candidate, also when an autodiscovered feed decided the outcome
+        self._count(outcome, url)
+        return feed_url
+
+    def validate_many(self, urls):
+        """Validate candidates concurrently, return {candidate: verified feed URL or None}."""
+        urls = list(urls)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(urls, executor.map(self.validate, urls)))
+
+    def report(self):
+        print(f"Feed validation: {self.stats['feeds']} feeds ({self.stats['discovered']} found by autodiscovery), "
+              f"{self.stats['rejected']} rejected, {self.stats['failed']} unreachable")
+
+
+def create_candidates_table(cursor):
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {CANDIDATES_TABLE_NAME} (
+        url TEXT PRIMARY KEY,
+        feed_url TEXT,
+        checked_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    ''')
+
+
+def validate_candidates(database, candidates, rss_links_table_name, validator=None):
+    """
+    Validate the candidates that were not checked in the last RECHECK_DAYS days and
+    insert the verified feed URLs into rss_links in one statement. Returns the number of new links.
+    """
+    validator = validator or FeedValidator()
+    with get_connection(database) as conn:
+        cursor = conn.cursor()
+        create_candidates_table(cursor)
+        conn.commit()
+        cursor.execute(f'''
+        SELECT url FROM {CANDIDATES_TABLE_NAME}
+        WHERE url = ANY(%s) AND checked_at > now() - INTERVAL '{RECHECK_DAYS} days'
+        ''', (list(candidates),))
+        recently_checked = {row[0] for row in cursor.fetchall()}
+
+    to_check = [url for url in candidates if url not in recently_checked]
+    print(f"Validating {len(to_check)} candidate links ({len(recently_checked)} checked recently)...")
+    results = validator.validate_many(to_check)
+    validator.report()
+
+    feed_urls = sorted({feed_url for feed_url in results.values() if feed_url})
+    # Unreachable candidates are not recorded, so the next crawl tries them again
+    checked = [(url, feed_url) for url, feed_url in results.items() if url not in validator.unreachable]
+
+    def store(conn):
+        cursor = conn.cursor()
+        if checked:
+            psycopg2.extras.execute_values(cursor, f'''
+            UPSERT INTO {CANDIDATES_TABLE_NAME} (url, feed_url, checked_at) VALUES %s
+            ''', checked, template="(%s, %s, now())", page_size=1000)
+        # Different candidates often redirect to spellings of the same feed
+        return len(insert_links(cursor, feed_urls, rss_links_table_name))
+
+    return run_transaction(database, store)
+
+
+def mark_non_feeds_dead(database, validator=None):
+    """One-off cleanup: probe every live rss_links entry and mark those that are not feeds as dead."""
+    validator = validator or FeedValidator()
+    with get_connection(database) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT link FROM rss_links WHERE dead_link = FALSE")
+        links = [row[0] for row in cursor.fetchall()]
+
+    results = validator.validate_many(links)
+    validator.report()
+    dead = [link for link, feed_url in results.items() if feed_url is None and link not in validator.unreachable]
+    if dead:
+        run_transaction(database, lambda conn: conn.cursor().execute(
+            "UPDATE rss_links SET dead_link = TRUE WHERE link = ANY(%s)", (dead,)))
+    print(f"Marked {len(dead)} of {len(links)} links as dead.")
+    return len(dead)
+
+
+if __name__ == "__main__":
+    DATABASE_PATH = st.secrets["cockroachdb"]["connection_string"]
+    mark_non_feeds_dead(DATABASE_PATH)
@@ -1,4 +1,5 @@
 import psycopg2
+from RssDbPool import get_connection
 import json
 import os
 import openai
@@ -8,17 +9,29 @@ import streamlit as st
 import requests
 from bs4 import BeautifulSoup
 
-from newspaper import Article
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from RssArticleFetcher import ArticleFetcher
+from RssLlmCache import get_cache
+from RssWorkQueue import WorkQueue
+from RssAnalysisStore import high_importance_filter, sync_analyses
+
+TWEET_MODEL = "gpt-4"
+DOWNLOAD_WORKERS = 16  # Article downloads in flight (per-domain limits apply on top)
+GENERATION_WORKERS = 4  # Tweets generated in parallel with the downloads
+MAX_TWEET_LENGTH = 280
+MAX_GENERATION_ATTEMPTS = 3  # LLM calls per tweet before falling back to trim_tweet
+TWEET_BATCH_SIZE = 50  # Entries read, generated and committed together
+
+_fetcher = None
+
+def get_fetcher():
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = ArticleFetcher()
+    return _fetcher
 
 def fetch_article_content(link):
-    try:
-        article = Article(link)
-        article.download()
-        article.parse()
-        return article.text
-    except Exception as e:
-        print(f"Failed to fetch content for link {link}. Error: {e}")
-        return None
+    return get_fetcher().fetch(link)
 
 def fetch_content_from_link(link):
     try:
@@ -41,136 +54,148 @@ def analyze_with_gpt4(title, custom_instruction):
     
     openai.api_key =  st.secrets["openai"]["openai_api_key"]
 
-    completion = openai.ChatCompletion.create(
-    model="gpt-4",
-    messages=[
-        {"role": "system", "content": custom_instruction},
-        {"role": "user", "content": title}
-    ],
-    # max_tokens=70,
-    )
-    return completion.choices[0].message
-
-def generate_valid_tweet(content, custom_tweet_instruction_generation):
-    custom_tweet_instruction = """
+    def create_completion():
+        completion = openai.ChatCompletion.create(
+        model=TWEET_MODEL,
+        messages=[
+            {"role": "system", "content": custom_instruction},
+            {"role": "user", "content": title}
+        ],
+        # max_tokens=70,
+        )
+        return completion.choices[0].message
+
+    return get_cache().get_or_call(TWEET_MODEL, custom_instruction, title, create_completion)
+
+def trim_tweet(text, max_length=MAX_TWEET_LENGTH):
+    """Deterministically shorten text to max_length: cut after the last full sentence, else the last word."""
+    text = text.strip().strip('"').strip()
+    if len(text) <= max_length:
+        return text
+
+    head = text[:max_length]
+    sentence_end = max(head.rfind(". "), head.rfind("! "), head.rfind("? "))
+    if sentence_end >= max_length // 2:
+        return head[:sentence_end + 1]
+
+    head = text[:max_length - 1]
+    word_end = head.rfind(" ")
+    if word_end > 0:
+        head = head[:word_end]
+    return head.rstrip(" ,;:-") + "…"
+
+def generate_valid_tweet(content, custom_tweet_instruction_generation, max_attempts=MAX_GENERATION_ATTEMPTS):
+    """
+    Generate a tweet of at most MAX_TWEET_LENGTH characters with at most max_attempts
+    LLM calls. Falls back to trim_tweet when the model does not get below the limit.
+    Returns (tweet, attempts).
+    """
+    custom_tweet_instruction = f"""
     
-    Create a shorter text with the same content and character lenght below or equal 280 
-    don't mention the character lenght in the text try to maximize the content lenght but stay below 280 characters, 
+    Create a shorter text with the same content and character lenght below or equal {MAX_TWEET_LENGTH} 
+    don't mention the character lenght in the text try to maximize the content lenght but stay below {MAX_TWEET_LENGTH} characters, 
     don't start and end with double quotes: 
     
     """
     
-    # Initially, generate a tweet
-    generated_tweet = analyze_with_gpt4(content, custom_tweet_instruction_generation)["content"]
-    
-    # While the tweet's character count is over 280, keep regenerating
-    while len(generated_tweet) > 280:
-        print("------")
-        print(generated_tweet)
+    # State the limit up front, so most tweets fit in the first call
+    length_hint = f"\nThe text must not be longer than {MAX_TWEET_LENGTH} characters."
+    generated_tweet = analyze_with_gpt4(content, custom_tweet_instruction_generation + length_hint)["content"]
+    attempts = 1
+
+    while len(generated_tweet) > MAX_TWEET_LENGTH and attempts < max_attempts:
         print(f"tweet is too long ({len(generated_tweet)}) paraphrasing:")
-        generated_tweet = generated_tweet + " character lenght is: " + str(len(generated_tweet))
-        generated_tweet = analyze_with_gpt4(generated_tweet, custom_tweet_instruction)["content"]
-        print("new tweet:")
-        print(generated_tweet)
-        print("------")
+        too_long = generated_tweet + " character lenght is: " + str(len(generated_tweet)) + \
+            f", remove at least {len(generated_tweet) - MAX_TWEET_LENGTH} characters"
+        generated_tweet = analyze_with_gpt4(too_long, custom_tweet_instruction)["content"]
+        attempts += 1
+
+    if len(generated_tweet) > MAX_TWEET_LENGTH:
+        print(f"tweet still too long ({len(generated_tweet)}) after {attempts} attempts, trimming")
+        generated_tweet = trim_tweet(generated_tweet)
 
-    return generated_tweet
+    return generated_tweet, attempts
 
-def fetch_high_importance_entries(db_params, custom_instruction, column_name, analysis_column_name):
+def generate_tweets_pipelined(entries, custom_instruction, download_workers=DOWNLOAD_WORKERS, generation_workers=GENERATION_WORKERS):
+    """
+    Download the articles of entries concurrently and generate each tweet as soon as
+    its article is ready, while the remaining downloads continue.
+    Yields (entry, tweet) in completion order.
+    """
+    fetcher = get_fetcher()
+    with ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+            ThreadPoolExecutor(max_workers=generation_workers) as generations:
+        download_futures = {downloads.submit(fetcher.fetch, entry["link"]): entry for entry in entries}
+        generation_futures = {}
+        pending = set(download_futures)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in download_futures:
+                    entry = download_futures[future]
+                    entry['content'] = future.result()
+                    custom_tweet_instruction = custom_instruction + "\nYou should concentrate on: " + entry["title"]
+                    generation = generations.submit(generate_valid_tweet, entry['content'], custom_tweet_instruction)
+                    generation_futures[generation] = entry
+                    pending.add(generation)
+                else:
+                    entry = generation_futures[future]
+                    try:
+                        tweet, entry['generation_attempts'] = future.result()
+                    except Exception as e:
+                        print(f"Error processing entry {entry['title']}. Error: {e}")
+                        continue
+                    yield entry, tweet
+
+    fetcher.report()
+    attempts = [entry['generation_attempts'] for entry in generation_futures.values() if 'generation_attempts' in entry]
+    if attempts:
+        print(f"Generated {len(attempts)} tweets with {sum(attempts) / len(attempts):.2f} LLM calls on average, "
+              f"{sum(1 for a in attempts if a >= MAX_GENERATION_ATTEMPTS)} hit the attempt cap.")
+
+def fetch_high_importance_entries(db_params, custom_instruction, column_name, analysis_column_name, batch_size=TWEET_BATCH_SIZE):
     # Connect to the database
-    conn = psycopg2.connect(db_params)
-    cursor = conn.cursor()
+    with get_connection(db_params) as conn:
+        cursor = conn.cursor()
     
-    # Fetch table names with the given prefix "rss_entries_"
-    cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_name LIKE 'rss_entries';")
-    tables = cursor.fetchall()
+        # Fetch table names with the given prefix "rss_entries_"
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_name LIKE 'rss_entries';")
+        tables = cursor.fetchall()
 
-    high_importance_entries = []
+        for table in tables:
+            table_name = table[0]
+            cursor.execute(f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS "{column_name}" TEXT;')
+            conn.commit()
 
+    generated = 0
     for table in tables:
         table_name = table[0]
-        
-        # Check if "generated_tweet" column exists
-        check_column_query = f"""
-        SELECT column_name 
-        FROM information_schema.columns 
-        WHERE table_name='{table_name}' AND column_name='{column_name}';
-        """
-        cursor.execute(check_column_query)
-        
-        # If column doesn't exist, add it
-        if not cursor.fetchone():
-            add_column_query = f"""
-            ALTER TABLE {table_name} ADD COLUMN "{column_name}" TEXT;
-            """
-            cursor.execute(add_column_query)
-            conn.commit()  # Commit the transaction immediately after adding the column
-            
-        # Fetch title, link, stocktraderanalysis, and generated_tweet column values
-        fetch_values_query = f"""
-        SELECT title, link, "{analysis_column_name}", "{column_name}" 
-        FROM {table_name} 
-        WHERE "{analysis_column_name}" IS NOT NULL;
-        """
-        cursor.execute(fetch_values_query)
-        entries = cursor.fetchall()
-        
-        for entry in entries:
-
-            title, link, text_data, _ = entry
-
-            try:
-                # Convert the text data into JSON
-                data = json.loads(json.loads(text_data)["content"])
-                
-                importance = data.get("Importance")
-                if importance and importance.lower() == "high":
-                    high_importance_entries.append({
-                        "title": title,
-                        "link": link,
-                        "analysis": data
-                    })
-            except (json.JSONDecodeError, KeyError):
-                print("Json decode error")
-                # Handle cases where the data isn't valid JSON or doesn't have the expected structure
-                pass
-
-    for entry in high_importance_entries:
-        try:
-            # Check if the tweet already exists for this entry
-            cursor.execute(f'''
-            SELECT "{column_name}" FROM {table_name} 
-            WHERE link = %s;
-            ''', (entry["link"],))
-            existing_tweet = cursor.fetchone()
-
-            # If tweet doesn't exist, generate and update
-            if not existing_tweet or existing_tweet[0] is None:
-                custom_tweet_instruction = custom_instruction + "\nYou should concentrate on: " + entry["title"]
-                content = fetch_article_content(entry["link"])
-                entry['content'] = content
-
-                generated_tweet = generate_valid_tweet(content, custom_tweet_instruction)
-                
-                # Save the tweet to the database
-                print(f"Updating entry with link: {entry['link']}")
-                cursor.execute(f'''
-                UPDATE {table_name} 
-                SET "{column_name}" = %s 
-                WHERE link = %s;
-                ''', (generated_tweet, entry["link"]))
-                print(f"Rows updated: {cursor.rowcount}")
-                conn.commit()  # Commit the transaction after updating the tweet
-
-                entry['tweet'] = generated_tweet
-                print(entry['tweet'])
-                # yield entry
-            else:
-                print(f"Tweet already exists for entry {entry['title']}.")
-
-        except Exception as e:
-            print(f"Error processing entry {entry['title']}. Error: {e}")
-
+        sync_analyses(db_params, table_name, analysis_column_name)
+
+        # Only high-importance entries without a tweet, looked up through the (profile, importance) index
+        importance_clause, importance_params = high_importance_filter(analysis_column_name)
+        queue = WorkQueue(
+            db_params, table_name, ["title", "link"],
+            where_clause=f'{importance_clause} AND "{column_name}" IS NULL AND is_canonical IS NOT FALSE',
+            update_query=f'UPDATE {table_name} SET "{column_name}" = %s WHERE rowid = %s;',
+            params=importance_params,
+            batch_size=batch_size,
+        )
+
+        def generate_batch(rows):
+            entries = [{"rowid": rowid, "title": title, "link": link} for rowid, title, link in rows]
+            updates = []
+            for entry, generated_tweet in generate_tweets_pipelined(entries, custom_instruction):
+                print(f"Generated tweet for link: {entry['link']}")
+                print(generated_tweet)
+                updates.append((generated_tweet, entry["rowid"]))
+            return updates
+
+        generated += queue.run(generate_batch)
+
+    print(f"Processed {generated} high-importance entries without a tweet.")
+    get_cache().report("Tweet generation cache")
 
     
 if __name__ == "__main__":
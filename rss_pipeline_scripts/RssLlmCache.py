@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Content-addressed cache for chat completions, stored in a local SQLite file.
+# The key is a hash of (model, system instruction, user content), so the same
+# headline from many publishers, or a re-run after renaming the analysis column,
+# never reaches the API twice.
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite3")
+CACHE_TTL_SECONDS = 30 * 24 * 3600
+CACHE_MAX_ENTRIES = 200000
+
+
+def cache_key(model, system_instruction, user_content):
+    digest = hashlib.sha256()
+    for part in (model, system_instruction, user_content):
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LlmCache:
+
+    def __init__(self, path=CACHE_PATH, ttl_seconds=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+        self._conn.commit()
+        self._evict()
+
+    def get(self, key):
+        """Return the cached response for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(response), now, now)
+            )
+            self._conn.commit()
+
+    def get_or_call(self, model, system_instruction, user_content, call):
+        """Return the cached response, or call() and cache what it returns (None is not cached)."""
+        key = cache_key(model, system_instruction, user_content)
+        response = self.get(key)
+        if response is None:
+            response = call()
+            if response is not None:
+                self.set(key, response)
+        return response
+
+    def _evict(self):
+        """Drop expired entries, then the least recently used ones above max_entries."""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self._conn.execute('''
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+            ''', (self.max_entries,))
+            self._conn.commit()
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self, label="LLM cache"):
+        """Print and reset the hit statistics of the current run."""
+        print(f"{label}: {self.hits} hits, {self.misses} misses, hit rate {self.hit_rate():.1%}")
+        self._evict()
+        self.hits = 0
+        self.misses = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide cache instance, opened on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LlmCache()
+        return _cache
@@ -0,0 +1,41 @@
+import threading
+
+# Models are registered with a loader at import time and only loaded the first
+# time a pipeline step asks for them, then cached for the rest of the process.
+
+_loaders = {}
+_models = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def register_model(name, loader):
+    """Register a zero-argument loader for name; nothing is loaded yet."""
+    with _registry_lock:
+        _loaders[name] = loader
+        _locks.setdefault(name, threading.Lock())
+
+
+def get_model(name):
+    """Return the model registered as name, loading it on first use."""
+    if name in _models:
+        return _models[name]
+    if name not in _loaders:
+        raise KeyError(f"No model registered as '{name}'")
+
+    # One lock per model, so loading one model does not block another
+    with _locks[name]:
+        if name not in _models:
+            print(f"Loading model: {name}")
+            _models[name] = _loaders[name]()
+    return _models[name]
+
+
+def loaded_models():
+    return list(_models)
+
+
+def unload_model(name):
+    """Drop the cached model so its memory can be freed; it is reloaded on next use."""
+    with _locks.get(name, _registry_lock):
+        _models.pop(name, None)
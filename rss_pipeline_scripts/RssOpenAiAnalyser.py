@@ -1,28 +1,95 @@
 import os
 import openai
 import psycopg2
+from RssDbPool import get_connection
+from RssWorkQueue import WorkQueue
+from RssRateLimiter import RateLimiter
+from RssLlmCache import get_cache, cache_key
+from RssTitleClustering import add_cluster_columns, propagate_cluster_results
+from RssAnalysisStore import sync_analyses
 import json
 import streamlit as st
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-def analyze_with_gpt4(title, custom_instruction):
+ANALYSIS_MODEL = "gpt-3.5-turbo"
+MAX_WORKERS = 8  # Concurrent API requests
+REQUESTS_PER_MINUTE = 3500
+TOKENS_PER_MINUTE = 90000
+MAX_ATTEMPTS = 5
+EXPECTED_COMPLETION_TOKENS = 150  # Budgeted per request before the real usage is known
+
+def _chat_completion(title, custom_instruction):
     openai.api_key = st.secrets["openai"]["openai_api_key"]
-    
-    completion = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
+    # Point api_base at a local OpenAI-compatible server to test without the real API
+    openai.api_base = st.secrets["openai"].get("api_base", openai.api_base)
+
+    return openai.ChatCompletion.create(
+        model=ANALYSIS_MODEL,
         messages=[
             {"role": "system", "content": custom_instruction},
             {"role": "user", "content": title}
         ]
     )
-    
-    return completion.choices[0].message
 
-def analyze_titles_in_cockroachdb(db_params, custom_instruction, column_name, language_filters=None, class_filters=None):
+def analyze_with_gpt4(title, custom_instruction):
+    return get_cache().get_or_call(
+        ANALYSIS_MODEL, custom_instruction, title,
+        lambda: _chat_completion(title, custom_instruction).choices[0].message
+    )
+
+def estimate_tokens(title, custom_instruction):
+    """Rough prompt size (4 characters per token) plus the expected completion."""
+    return (len(custom_instruction) + len(title or "")) // 4 + EXPECTED_COMPLETION_TOKENS
+
+def _retry_after(error):
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def analyze_title(title, custom_instruction, limiter, max_attempts=MAX_ATTEMPTS):
+    """Analyze one title within the limiter's budget, None if it failed or every attempt was rate limited."""
+    cache = get_cache()
+    key = cache_key(ANALYSIS_MODEL, custom_instruction, title)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    estimated_tokens = estimate_tokens(title, custom_instruction)
+    for attempt in range(1, max_attempts + 1):
+        limiter.acquire(estimated_tokens)
+        try:
+            completion = _chat_completion(title, custom_instruction)
+        except openai.error.RateLimitError as e:
+            limiter.record_rate_limited(_retry_after(e))
+            continue
+        except (openai.error.Timeout, openai.error.APIConnectionError, openai.error.ServiceUnavailableError):
+            time.sleep(2 ** attempt)
+            continue
+        except openai.error.OpenAIError as e:
+            # Not transient (invalid request, auth, API error): skip the title, keep the rest of the batch
+            print(f"Failed to analyze title ({type(e).__name__}: {e}): {title}")
+            return None
+
+        usage = completion.get("usage") or {}
+        limiter.record_success(estimated_tokens, usage.get("total_tokens"))
+        analysis = completion.choices[0].message
+        cache.set(key, analysis)
+        print(analysis)
+        return analysis
+
+    print(f"Failed to analyze title after {max_attempts} attempts: {title}")
+    return None
+
+def analyze_titles_in_cockroachdb(db_params, custom_instruction, column_name, language_filters=None, class_filters=None,
+                                  max_workers=MAX_WORKERS, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
     retries = 3
-    for _ in range(retries):
+    for attempt in range(retries):
         try:
-            with psycopg2.connect(db_params) as conn:
+            with get_connection(db_params) as conn:
                 with conn.cursor() as cursor:
                     cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_name LIKE 'rss_entries%';")
                     tables = cursor.fetchall()
@@ -34,57 +101,55 @@ def analyze_titles_in_cockroachdb(db_params, custom_instruction, column_name, la
                         if not cursor.fetchone():
                             cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN \"{column_name}\" TEXT;")
                             conn.commit()
-
-                        where_clauses = [f"\"{column_name}\" IS NULL"]
-                        params = []
-
-                        if language_filters:
-                            where_clauses.append("(ai_language = ANY(%s) OR (ai_language IS NULL AND language = ANY(%s)))")
-                            params.extend([language_filters, language_filters])
-
-                        if class_filters:
-                            where_clauses.append("class = ANY(%s)")
-                            params.append(class_filters)
-
-                        where_clause = " AND ".join(where_clauses)
-                        if where_clause:
-                            where_clause = "WHERE " + where_clause
-
-                        cursor.execute(f"SELECT title FROM {table_name} {where_clause};", params)
-
-                        titles = [row[0] for row in cursor.fetchall()]
-
-                        print(len(titles))
-
-                        for title in titles:
-                            max_retries = 3
-                            retries = 0
-                            while retries < max_retries:
-                                try:
-                                    analysis = analyze_with_gpt4(title, custom_instruction)
-                                    print(analysis)
-                                    cursor.execute(f"UPDATE {table_name} SET \"{column_name}\" = %s WHERE title = %s;", (json.dumps(analysis), title))
-                                    conn.commit()
-                                    break
-                                except openai.error.Timeout:
-                                    retries += 1
-                                    wait_time = 2 ** retries
-                                    time.sleep(wait_time)
-
+                        add_cluster_columns(cursor, table_name)
+                        conn.commit()
+
+            # Near-duplicate titles are analyzed once, through their cluster's canonical entry
+            where_clauses = [f"\"{column_name}\" IS NULL", "is_canonical IS NOT FALSE"]
+            params = []
+
+            if language_filters:
+                where_clauses.append("(ai_language = ANY(%s) OR (ai_language IS NULL AND language = ANY(%s)))")
+                params.extend([language_filters, language_filters])
+
+            if class_filters:
+                where_clauses.append("class = ANY(%s)")
+                params.append(class_filters)
+
+            where_clause = " AND ".join(where_clauses)
+
+            for table in tables:
+                table_name = table[0]
+                queue = WorkQueue(
+                    db_params, table_name, ["title"],
+                    where_clause=where_clause,
+                    update_query=f"UPDATE {table_name} SET \"{column_name}\" = %s WHERE title = %s;",
+                    params=params,
+                )
+                analyzed = queue.run(lambda rows: analyze_batch(rows, custom_instruction, limiter, max_workers))
+                print(f"Analyzed {analyzed} titles in {table_name}, rate limited {limiter.rate_limited_count} times")
+                propagate_cluster_results(db_params, column_name, table_name)
+                sync_analyses(db_params, table_name, column_name)
+
+            get_cache().report("Analysis cache")
             # If the above logic completes without an error, break out of the loop
             break
         except psycopg2.OperationalError as e:
             # Log the error (consider using the logging module)
             print(f"Database error: {e}")
-            # Close the connection if it's not already closed
-            if conn and not conn.closed:
-                conn.close()
             # If we've reached the max number of retries, re-raise the error
-            if _ == retries - 1:
+            if attempt == retries - 1:
                 raise
             # Otherwise, wait for a short duration before retrying
             time.sleep(5)
 
+def analyze_batch(rows, custom_instruction, limiter, max_workers=MAX_WORKERS):
+    """Analyze the distinct titles of a batch concurrently, return (analysis, title) update parameters."""
+    titles = list(dict.fromkeys(title for _, title in rows))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        analyses = list(executor.map(lambda title: analyze_title(title, custom_instruction, limiter), titles))
+    return [(json.dumps(analysis), title) for title, analysis in zip(titles, analyses) if analysis is not None]
+
 
 if __name__ == "__main__":
 
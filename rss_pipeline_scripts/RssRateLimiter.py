@@ -0,0 +1,116 @@
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Refills at rate_per_minute up to capacity; the level may go negative after a correction."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount can be taken (amounts above capacity wait for a full bucket)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0) / self.rate
+
+    def consume(self, amount):
+        self.level -= amount
+
+
+class RateLimiter:
+    """
+    Keeps concurrent API calls within a requests-per-minute and a tokens-per-minute
+    budget. On a 429 all callers pause for the Retry-After time and the request
+    rate is cut, then it recovers step by step with every successful call.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, min_rate_fraction=0.1):
+        self._lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_request_rate = self.requests.rate
+        self.min_request_rate = self.max_request_rate * min_rate_fraction
+        self._paused_until = 0.0
+        self._consecutive_limits = 0
+        self.rate_limited_count = 0
+
+    def acquire(self, tokens=1):
+        """Block until one request of the given estimated token count may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(
+                    self._paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(tokens, now),
+                )
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(tokens)
+                    return
+            time.sleep(wait)
+
+    def record_success(self, estimated_tokens, used_tokens=None):
+        """Correct the token budget with the real usage and let the request rate recover."""
+        with self._lock:
+            if used_tokens is not None:
+                self.tokens.consume(used_tokens - estimated_tokens)
+            self._consecutive_limits = 0
+            self.requests.rate = min(self.max_request_rate, self.requests.rate + self.max_request_rate * 0.05)
+
+    def record_rate_limited(self, retry_after=None):
+        """Pause everyone for retry_after seconds (or a backoff) and slow the request rate down."""
+        with self._lock:
+            self.rate_limited_count += 1
+            self._consecutive_limits += 1
+            if retry_after is None:
+                retry_after = min(2 ** self._consecutive_limits, 60)
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self.requests.rate = max(self.min_request_rate, self.requests.rate * 0.5)
+
+
+class DomainLimiter:
+    """Politeness limits for crawling: at most max_concurrent requests per domain, started at least interval seconds apart."""
+
+    def __init__(self, max_concurrent=2, interval=1.0):
+        self.max_concurrent = max_concurrent
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_request = {}
+
+    @staticmethod
+    def domain(url):
+        return urlparse(url).netloc.lower()
+
+    def _semaphore(self, domain):
+        with self._lock:
+            if domain not in self._semaphores:
+                self._semaphores[domain] = threading.BoundedSemaphore(self.max_concurrent)
+            return self._semaphores[domain]
+
+    def _wait_for_slot(self, domain):
+        """Reserve the next request slot of the domain and sleep until it starts."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_request.get(domain, now))
+            self._next_request[domain] = start + self.interval
+        time.sleep(start - now)
+
+    @contextmanager
+    def limit(self, url):
+        """Hold a request slot of url's domain for the duration of the block."""
+        domain = self.domain(url)
+        with self._semaphore(domain):
+            self._wait_for_slot(domain)
+            yield
@@ -0,0 +1,131 @@
+import json
+from datetime import datetime, timedelta, timezone
+import streamlit as st
+from RssDbPool import get_connection
+from RssWorkQueue import WorkQueue
+from RssDateParser import parse_date
+
+# Brings rss_entries from its original all-TEXT layout to a typed schema:
+# published_at / inserted_at timestamps, a stable id and the indexes the pipeline
+# steps and dashboards filter on. Every step is idempotent, so the migration can
+# run at the start of every pipeline run.
+
+ENTRY_TABLE = "rss_entries"
+BACKFILL_BATCH_SIZE = 5000
+INDEXED_COLUMNS = ["published_at", "inserted_at", "class", "ai_language"]
+# Columns that stay NULL until a pipeline step has processed the entry
+PENDING_COLUMNS = ["class", "sentiment", "ai_language"]
+# unique_rowid() is (10 microsecond units since 2015-01-01 UTC << 15) | node id
+ROWID_EPOCH = 1420070400
+
+
+def rowid_to_datetime(rowid):
+    """Creation time of a row as encoded in its unique_rowid()."""
+    return datetime.fromtimestamp(ROWID_EPOCH + (rowid >> 15) / 100000, tz=timezone.utc)
+
+
+def inserted_since(hours):
+    """Lower bound on inserted_at for the entries of the last hours."""
+    return datetime.now(timezone.utc) - timedelta(hours=hours)
+
+
+def add_entry_columns(cursor, table_name=ENTRY_TABLE):
+    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS published_at TIMESTAMPTZ;")
+    # No default yet, so existing rows can be backfilled from their rowid instead of the migration time
+    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS inserted_at TIMESTAMPTZ;")
+    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS id UUID NOT NULL DEFAULT gen_random_uuid();")
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table_name}_id_key ON {table_name} (id);")
+
+
+def _table_exists(cursor, table_name):
+    cursor.execute("SELECT 1 FROM information_schema.tables WHERE table_name = %s;", (table_name,))
+    return cursor.fetchone() is not None
+
+
+def _existing_columns(cursor, table_name):
+    cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = %s;", (table_name,))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def create_entry_indexes(cursor, table_name=ENTRY_TABLE, status_columns=()):
+    """Index the filter columns, plus partial indexes over the entries each step still has to process."""
+    existing = _existing_columns(cursor, table_name)
+    for column in INDEXED_COLUMNS:
+        if column in existing:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS "{table_name}_{column}_idx" ON {table_name} ("{column}");')
+
+    for column in PENDING_COLUMNS + list(status_columns):
+        if column in existing:
+            cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS "{table_name}_{column}_pending_idx" ON {table_name} (rowid)
+            WHERE "{column}" IS NULL;
+            ''')
+
+
+def inserted_at_updates(rows):
+    """(inserted_at, rowid) update parameters for a batch of (rowid, inserted_at) rows."""
+    return [(rowid_to_datetime(rowid), rowid) for rowid, _ in rows]
+
+
+def backfill_inserted_at(db_params, table_name=ENTRY_TABLE, batch_size=BACKFILL_BATCH_SIZE):
+    """Derive inserted_at from the rowid for the entries stored before the column existed."""
+    queue = WorkQueue(
+        db_params, table_name, ["inserted_at"],
+        where_clause="inserted_at IS NULL",
+        update_query=f"UPDATE {table_name} SET inserted_at = %s WHERE rowid = %s;",
+        batch_size=batch_size,
+    )
+    backfilled = queue.run(inserted_at_updates)
+
+    with get_connection(db_params) as conn:
+        conn.cursor().execute(f"ALTER TABLE {table_name} ALTER COLUMN inserted_at SET DEFAULT now();")
+    return backfilled
+
+
+def backfill_published_at(db_params, table_name=ENTRY_TABLE, batch_size=BACKFILL_BATCH_SIZE):
+    """Parse published into published_at; entries without a recognizable date keep NULL."""
+    queue = WorkQueue(
+        db_params, table_name, ["published"],
+        where_clause="published_at IS NULL",
+        update_query=f"UPDATE {table_name} SET published_at = %s WHERE rowid = %s;",
+        batch_size=batch_size,
+    )
+
+    def parse_batch(rows):
+        parsed = [(parse_date(published), rowid) for rowid, published in rows]
+        return [update for update in parsed if update[0] is not None]
+
+    return queue.run(parse_batch)
+
+
+def migrate_entries_schema(db_params, table_name=ENTRY_TABLE, status_columns=()):
+    """Add the typed columns, backfill them and create the indexes."""
+    with get_connection(db_params) as conn:
+        cursor = conn.cursor()
+        # On a fresh database the reader creates the table with the typed columns on its first run
+        if not _table_exists(cursor, table_name):
+            print(f"{table_name} does not exist yet, nothing to migrate.")
+            return
+        add_entry_columns(cursor, table_name)
+
+    inserted = backfill_inserted_at(db_params, table_name)
+    published = backfill_published_at(db_params, table_name)
+
+    with get_connection(db_params) as conn:
+        create_entry_indexes(conn.cursor(), table_name, status_columns)
+
+    print(f"Migrated {table_name}: backfilled inserted_at for {inserted} and checked published_at for {published} entries.")
+
+
+if __name__ == "__main__":
+
+    def load_config():
+        with open("/Users/danieltremer/Documents/RssFeed_Analyser/rss-frontend-repo/rss_pipeline_scripts/config.json", "r") as file:
+            return json.load(file)
+
+    config = load_config()
+    ANALYSIS_COLUMN_NAME = config["params"]["ANALYSIS_COLUMN_NAME_BASE"] + config["suffixes"]["ANALYSIS_COLUMN_NAME"]
+    TWEET_COLUMN_NAME = config["params"]["ANALYSIS_COLUMN_NAME_BASE"] + config["suffixes"]["TWEET_COLUMN_NAME"]
+    DATABASE_PATH = st.secrets["cockroachdb"]["connection_string"]
+
+    migrate_entries_schema(DATABASE_PATH, status_columns=[ANALYSIS_COLUMN_NAME, TWEET_COLUMN_NAME])
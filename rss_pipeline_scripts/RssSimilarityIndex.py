@@ -0,0 +1,93 @@
+import numpy as np
+from RssEmbeddingCodec import decode_embedding
+from RssSchemaMigration import inserted_since
+
+# Cosine-similarity dedup for the tweet scheduler: candidates are compared against
+# each other and against the tweets scheduled in earlier runs with matrix products.
+
+SCHEDULED_HISTORY_DAYS = 7  # Earlier scheduled tweets that new candidates are deduplicated against
+
+
+class SimilarityIndex:
+    """
+    L2-normalized embeddings kept in one growing matrix, so candidates are checked
+    against everything in the index with matrix products instead of pairwise calls.
+    """
+
+    BLOCK_SIZE = 1024  # Candidates compared per matrix product, bounds the memory used
+
+    def __init__(self, capacity=1024):
+        self._matrix = None
+        self._count = 0
+        self._capacity = capacity
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, vector):
+        """Add an already normalized vector."""
+        if self._matrix is None:
+            self._matrix = np.empty((self._capacity, vector.size), dtype=np.float32)
+        elif self._count == len(self._matrix):
+            self._matrix = np.vstack([self._matrix, np.empty_like(self._matrix)])
+        self._matrix[self._count] = vector
+        self._count += 1
+
+    def is_similar(self, vector, threshold=0.8):
+        """True if any indexed embedding has a cosine similarity above threshold with vector."""
+        if not self._count or self._matrix.shape[1] != vector.size:
+            return False
+        return bool((self._matrix[:self._count] @ vector).max() > threshold)
+
+    def select_unique(self, vectors, threshold=0.8):
+        """
+        Go through normalized candidate vectors in order and keep a candidate unless it
+        is similar to the index or to an earlier kept candidate; kept candidates are
+        added to the index. Returns the positions of the kept candidates. Empty
+        vectors (no embedding) are always kept and not indexed.
+        """
+        positions = [i for i, vector in enumerate(vectors) if vector.size]
+        kept = set(range(len(vectors))) - set(positions)
+        if not positions:
+            return sorted(kept)
+
+        candidates = np.vstack([vectors[i] for i in positions])
+        similar_to_index = np.zeros(len(positions), dtype=bool)
+        earlier_neighbours = [[] for _ in positions]
+
+        for start in range(0, len(positions), self.BLOCK_SIZE):
+            end = min(start + self.BLOCK_SIZE, len(positions))
+            block = candidates[start:end]
+            if self._count:
+                similar_to_index[start:end] = (block @ self._matrix[:self._count].T).max(axis=1) > threshold
+            # Similar pairs among the candidates, only towards earlier candidates
+            rows, cols = np.nonzero(np.tril(block @ candidates[:end].T > threshold, k=start - 1))
+            for row, col in zip(rows, cols):
+                earlier_neighbours[start + row].append(col)
+
+        kept_candidates = np.zeros(len(positions), dtype=bool)
+        for i in range(len(positions)):
+            if similar_to_index[i] or any(kept_candidates[j] for j in earlier_neighbours[i]):
+                continue
+            kept_candidates[i] = True
+            kept.add(positions[i])
+            self.add(candidates[i])
+        return sorted(kept)
+
+
+def load_scheduled_embeddings(cursor, index, history_days=SCHEDULED_HISTORY_DAYS):
+    """Add the embeddings of tweets scheduled in earlier runs (within history_days) to index."""
+    cursor.execute("""
+        SELECT embedding_bin, embedding FROM rss_entries
+        WHERE scheduled = TRUE AND inserted_at >= %s AND (embedding_bin IS NOT NULL OR embedding IS NOT NULL);
+    """, (inserted_since(history_days * 24),))
+    for embedding_bin, embedding in cursor.fetchall():
+        vector = decode_embedding(embedding_bin if embedding_bin is not None else embedding)
+        if vector.size:
+            index.add(SimilarityIndex.normalize(vector))
@@ -0,0 +1,136 @@
+import json
+import numpy as np
+import psycopg2.extras
+import streamlit as st
+from RssDbPool import get_connection, run_transaction
+from RssEmbeddingCodec import decode_embedding, EMBEDDING_COLUMN, LEGACY_EMBEDDING_COLUMN
+from RssSchemaMigration import inserted_since
+
+# Groups near-identical headlines (the same story syndicated by many feeds) using
+# the gte-small embeddings written by RssEntryClassifier. Every cluster gets one
+# canonical entry; only canonical entries are sent to the LLM and their analysis
+# is copied to the rest of the cluster afterwards.
+
+DEFAULT_CLUSTER_THRESHOLD = 0.92
+DEFAULT_WINDOW_HOURS = 48
+
+
+def add_cluster_columns(cursor, table_name="rss_entries"):
+    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS cluster_id INT8;")
+    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS is_canonical BOOLEAN;")
+
+
+def assign_clusters(rowids, embeddings, threshold, seeds=()):
+    """
+    Greedy leader clustering in rowid order. An entry joins the cluster of the most
+    similar canonical entry if the cosine similarity reaches threshold, otherwise it
+    becomes the canonical entry of a new cluster (cluster id = its rowid).
+
+    seeds are (cluster_id, embedding) pairs of canonical entries from earlier runs.
+    Returns {rowid: (cluster_id, is_canonical)}.
+    """
+    seeds = list(seeds)
+    dim = embeddings.shape[1] if len(embeddings) else (len(seeds[0][1]) if seeds else 0)
+    canonical = np.empty((len(seeds) + len(rowids), dim), dtype=np.float32)
+    canonical_ids = []
+
+    for cluster_id, embedding in seeds:
+        canonical[len(canonical_ids)] = _normalize(embedding)
+        canonical_ids.append(cluster_id)
+
+    assignments = {}
+    for rowid, embedding in zip(rowids, embeddings):
+        vector = _normalize(embedding)
+        count = len(canonical_ids)
+        if count:
+            # One matrix-vector product against every canonical entry so far
+            similarities = canonical[:count] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                assignments[rowid] = (canonical_ids[best], False)
+                continue
+        canonical[count] = vector
+        canonical_ids.append(rowid)
+        assignments[rowid] = (rowid, True)
+    return assignments
+
+
+def _normalize(embedding):
+    embedding = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(embedding)
+    return embedding / norm if norm else embedding
+
+
+def cluster_titles_in_db(cockroachdb_conn_str, threshold=DEFAULT_CLUSTER_THRESHOLD, window_hours=DEFAULT_WINDOW_HOURS, table_name="rss_entries"):
+    """Cluster the unclustered entries of the time window and store cluster_id / is_canonical."""
+    with get_connection(cockroachdb_conn_str) as conn:
+        cursor = conn.cursor()
+        add_cluster_columns(cursor, table_name)
+        conn.commit()
+
+        cursor.execute(f'''
+        SELECT rowid, cluster_id, is_canonical, {EMBEDDING_COLUMN}, {LEGACY_EMBEDDING_COLUMN} FROM {table_name}
+        WHERE inserted_at >= %s AND ({EMBEDDING_COLUMN} IS NOT NULL OR {LEGACY_EMBEDDING_COLUMN} IS NOT NULL)
+        AND (cluster_id IS NULL OR is_canonical)
+        ORDER BY rowid
+        ''', (inserted_since(window_hours),))
+        rows = cursor.fetchall()
+
+    seeds = []
+    new_rowids = []
+    new_embeddings = []
+    for rowid, cluster_id, is_canonical, embedding_bin, embedding in rows:
+        vector = decode_embedding(embedding_bin if embedding_bin is not None else embedding)
+        if not vector.size:
+            continue
+        if cluster_id is not None:
+            seeds.append((cluster_id, vector))
+        else:
+            new_rowids.append(rowid)
+            new_embeddings.append(vector)
+
+    if not new_rowids:
+        print("No new entries to cluster.")
+        return 0
+
+    assignments = assign_clusters(new_rowids, np.vstack(new_embeddings), threshold, seeds)
+    updates = [(cluster_id, is_canonical, rowid) for rowid, (cluster_id, is_canonical) in assignments.items()]
+
+    def write(conn):
+        psycopg2.extras.execute_batch(conn.cursor(), f"UPDATE {table_name} SET cluster_id = %s, is_canonical = %s WHERE rowid = %s", updates, page_size=500)
+
+    run_transaction(cockroachdb_conn_str, write)
+    canonical_count = sum(1 for _, is_canonical, _ in updates if is_canonical)
+    print(f"Clustered {len(updates)} entries, {canonical_count} canonical, {len(updates) - canonical_count} duplicates.")
+    return len(updates)
+
+
+def propagate_cluster_results(cockroachdb_conn_str, column_name, table_name="rss_entries"):
+    """Copy column_name from each canonical entry to the members of its cluster that have none."""
+    def update(conn):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        UPDATE {table_name} AS member SET "{column_name}" = canonical."{column_name}"
+        FROM {table_name} AS canonical
+        WHERE member.cluster_id = canonical.cluster_id
+        AND canonical.is_canonical AND NOT member.is_canonical
+        AND member."{column_name}" IS NULL AND canonical."{column_name}" IS NOT NULL
+        ''')
+        return cursor.rowcount
+
+    updated = run_transaction(cockroachdb_conn_str, update)
+    print(f"Copied {column_name} to {updated} duplicate entries.")
+    return updated
+
+
+if __name__ == "__main__":
+
+    def load_config():
+        with open("/Users/danieltremer/Documents/RssFeed_Analyser/rss-frontend-repo/rss_pipeline_scripts/config.json", "r") as file:
+            return json.load(file)
+
+    config = load_config()
+    DATABASE_PATH = st.secrets["cockroachdb"]["connection_string"]
+
+    cluster_titles_in_db(DATABASE_PATH, threshold=float(config["params"]["CLUSTER_THRESHOLD"]),
+                         window_hours=float(config["params"]["CLUSTER_WINDOW_HOURS"]))
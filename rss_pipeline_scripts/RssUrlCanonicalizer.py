@@ -0,0 +1,212 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import psycopg2.extras
+import streamlit as st
+from RssDbPool import get_connection, run_transaction
+from RssFeedScheduler import add_schedule_columns
+
+# The same feed reaches rss_links under many spellings: http and https, with and
+# without a trailing slash, with utm_* parameters from a newsletter, through a
+# FeedBurner alias or with an upper-case host. canonical_link holds one spelling
+# per feed and carries a unique index, so a feed is stored once however it was found.
+# link keeps the URL that is actually fetched; canonical_link is only a key and is
+# never requested (it may name https for an http-only site or drop a needed slash).
+
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid", "_ga", "_hsenc", "_hsmi"}
+TRACKING_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+FEEDBURNER_HOSTS = {"feeds.feedburner.com", "feeds2.feedburner.com", "feedproxy.google.com"}
+FEEDBURNER_PARAMS = {"format", "fmt"}  # ?format=xml only selects the output format
+CANONICAL_INDEX_NAME = "rss_links_canonical_link_key"
+# rss_links columns carried over when duplicate rows are merged, with their SQL types
+MERGED_COLUMNS = ["link", "canonical_link", "dead_link", "etag", "last_modified", "content_hash",
+                  "last_polled_at", "last_changed_at", "entry_rate", "poll_interval", "next_due_at", "failure_count"]
+MERGE_TEMPLATE = ("(%s, %s, %s::BOOL, %s::STRING, %s::STRING, %s::STRING, %s::TIMESTAMPTZ, %s::TIMESTAMPTZ, "
+                  "%s::FLOAT8, %s::INT8, %s::TIMESTAMPTZ, %s::INT8)")
+
+
+def _is_tracking_param(key, host):
+    key = key.lower()
+    if key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES):
+        return True
+    return host in FEEDBURNER_HOSTS and key in FEEDBURNER_PARAMS
+
+
+def canonicalize_url(url):
+    """
+    Canonical spelling of a feed URL: https scheme, lower-case host without default
+    port, no fragment, tracking parameters or trailing slash, remaining parameters
+    sorted and FeedBurner aliases folded into feeds.feedburner.com/<name>.
+    Values that are not http(s) URLs are returned stripped.
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").rstrip(".")
+        port = parts.port
+    except ValueError:
+        return url
+    if parts.scheme.lower() not in DEFAULT_PORTS or not host:
+        return url
+
+    netloc = host
+    if port is not None and port != DEFAULT_PORTS[parts.scheme.lower()]:
+        netloc = f"{host}:{port}"
+
+    path = parts.path.rstrip("/")
+    if host in FEEDBURNER_HOSTS:
+        # Feed names are case-insensitive and every alias serves the same feed
+        netloc = "feeds.feedburner.com"
+        path = path.lower()
+
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if not _is_tracking_param(key, host)]
+    return urlunsplit(("https", netloc, path, urlencode(sorted(query)), ""))
+
+
+def add_canonical_column(cursor):
+    # The state columns of the reader and the feed scheduler, so duplicates can be merged into the kept row
+    cursor.execute('''
+    ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS canonical_link TEXT;
+    ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS dead_link BOOLEAN DEFAULT FALSE;
+    ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS etag TEXT;
+    ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS last_modified TEXT;
+    ALTER TABLE rss_links ADD COLUMN IF NOT EXISTS content_hash TEXT;
+    ''')
+    add_schedule_columns(cursor)
+
+
+def _keep_order(row):
+    """The row that survives a merge: live before dead, https before http, then the shortest link."""
+    return bool(row["dead_link"]), not row["link"].lower().startswith("https://"), len(row["link"]), row["link"]
+
+
+def _latest(values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _earliest(values):
+    values = [value for value in values if value is not None]
+    return min(values) if values else None
+
+
+def merge_link_state(rows):
+    """
+    Merge the rss_links rows (dicts of MERGED_COLUMNS) of one feed into the row that is kept.
+    Returns (kept row with the merged state, links of the duplicates to delete). The
+    conditional GET validators come from the most recently polled row that has any;
+    the schedule keeps the latest poll and change, the highest entry rate and the
+    soonest due time, so the merged feed is polled as often as its busiest spelling.
+    """
+    rows = sorted(rows, key=_keep_order)
+    kept = dict(rows[0])
+
+    with_validators = [row for row in rows if row["etag"] or row["last_modified"]]
+    if with_validators:
+        polled_at = [row["last_polled_at"] for row in with_validators if row["last_polled_at"] is not None]
+        newest = max(polled_at) if polled_at else None
+        source = next((row for row in with_validators if row["last_polled_at"] == newest), with_validators[0])
+        kept["etag"], kept["last_modified"], kept["content_hash"] = source["etag"], source["last_modified"], source["content_hash"]
+
+    kept["last_polled_at"] = _latest(row["last_polled_at"] for row in rows)
+    kept["last_changed_at"] = _latest(row["last_changed_at"] for row in rows)
+    kept["entry_rate"] = _latest(row["entry_rate"] for row in rows)
+    kept["poll_interval"] = _earliest(row["poll_interval"] for row in rows)
+    kept["next_due_at"] = _earliest(row["next_due_at"] for row in rows)
+    kept["failure_count"] = _earliest(row["failure_count"] for row in rows)
+    return kept, [row["link"] for row in rows[1:]]
+
+
+def _load_unmerged_rows(cursor):
+    """Rows without canonical_link, plus the rows that already hold one of their canonical links."""
+    columns = ", ".join(MERGED_COLUMNS)
+    cursor.execute(f"SELECT {columns} FROM rss_links WHERE canonical_link IS NULL")
+    rows = [dict(zip(MERGED_COLUMNS, row)) for row in cursor.fetchall()]
+    if not rows:
+        return rows
+    cursor.execute(f"SELECT {columns} FROM rss_links WHERE canonical_link = ANY(%s)",
+                   (list({canonicalize_url(row["link"]) for row in rows}),))
+    return rows + [dict(zip(MERGED_COLUMNS, row)) for row in cursor.fetchall()]
+
+
+def merge_duplicate_links(database):
+    """
+    Fill canonical_link for the rows that have none, merge every group of rows with
+    the same canonical link into one row and create the unique index, all in one
+    transaction. Rows inserted through insert_links already carry canonical_link,
+    so after the first run this only looks at rows added by other means.
+    Returns the number of deleted duplicates.
+    """
+    with get_connection(database) as conn:
+        cursor = conn.cursor()
+        add_canonical_column(cursor)
+
+    def merge(conn):
+        cursor = conn.cursor()
+        # DDL first: CockroachDB rejects schema changes after writes in a transaction, and
+        # the index is only built at commit, after the duplicates below are gone
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {CANONICAL_INDEX_NAME} ON rss_links (canonical_link)")
+
+        groups = {}
+        for row in _load_unmerged_rows(cursor):
+            groups.setdefault(canonicalize_url(row["link"]), {})[row["link"]] = row
+
+        kept_rows = []
+        duplicates = []
+        for canonical, rows in groups.items():
+            kept, duplicate_links = merge_link_state(rows.values())
+            kept["canonical_link"] = canonical
+            kept_rows.append(tuple(kept[column] for column in MERGED_COLUMNS))
+            duplicates.extend(duplicate_links)
+
+        # Duplicates go first, one of them may hold the canonical link the kept row takes over
+        if duplicates:
+            cursor.execute("DELETE FROM rss_links WHERE link = ANY(%s)", (duplicates,))
+        if kept_rows:
+            psycopg2.extras.execute_values(cursor, f'''
+            UPDATE rss_links SET {", ".join(f"{column} = v.{column}" for column in MERGED_COLUMNS[1:])}
+            FROM (VALUES %s) AS v({", ".join(MERGED_COLUMNS)})
+            WHERE rss_links.link = v.link
+            ''', kept_rows, template=MERGE_TEMPLATE, page_size=1000)
+        return len(kept_rows), len(duplicates)
+
+    merged, removed = run_transaction(database, merge)
+    if merged:
+        print(f"Canonical links: stored for {merged} feeds, merged and removed {removed} duplicates")
+    return removed
+
+
+def new_canonical_links(cursor, links, table_name="rss_links"):
+    """
+    Canonicalize links, drop duplicates among them and those already in table_name.
+    Returns {canonical link: first link that produced it}.
+    """
+    candidates = {}
+    for link in links:
+        candidates.setdefault(canonicalize_url(link), link)
+    if not candidates:
+        return candidates
+
+    cursor.execute(f"SELECT canonical_link FROM {table_name} WHERE canonical_link = ANY(%s)", (list(candidates),))
+    for (canonical_link,) in cursor.fetchall():
+        candidates.pop(canonical_link, None)
+    return candidates
+
+
+def insert_links(cursor, links, table_name="rss_links"):
+    """Insert links with their canonical form, skipping any that already exist under either. Returns the inserted links."""
+    rows = list(new_canonical_links(cursor, links, table_name).items())
+    if not rows:
+        return []
+    inserted = psycopg2.extras.execute_values(cursor, f'''
+    INSERT INTO {table_name} (canonical_link, link) VALUES %s
+    ON CONFLICT DO NOTHING
+    RETURNING link
+    ''', rows, page_size=1000, fetch=True)
+    return [row[0] for row in inserted]
+
+
+if __name__ == "__main__":
+    DATABASE_PATH = st.secrets["cockroachdb"]["connection_string"]
+    merge_duplicate_links(DATABASE_PATH)
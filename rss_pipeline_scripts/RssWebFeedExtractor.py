@@ -3,6 +3,7 @@ from PyPDF2 import PdfFileReader
 from bs4 import BeautifulSoup
 from io import BytesIO
 import csv
+import hashlib
 import os
 import re
 import requests
@@ -12,16 +13,89 @@ import psycopg2
 import streamlit as st
 import psycopg2.extras
 import json
+from lxml import etree
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from RssDbPool import get_connection, run_transaction
+from RssRateLimiter import DomainLimiter
+from RssFeedValidator import validate_candidates
+from RssUrlCanonicalizer import merge_duplicate_links, new_canonical_links, insert_links
+
+CRAWL_WORKERS = 16  # Pages fetched concurrently
+CRAWL_PER_DOMAIN_LIMIT = 8  # Concurrent requests per domain (most seeds live on github.com)
+CRAWL_PER_DOMAIN_INTERVAL = 0.1  # Minimum seconds between two requests to the same domain
+RESOURCE_EXTENSIONS = ('.csv', '.yml', '.yaml', '.opml', '.txt', '.pdf')
+CRAWL_STATE_TABLE_NAME = "crawl_state"  # Per-URL validators and extracted links of earlier crawls
+EXTRACTION_BACKEND = "lxml"  # "lxml" streams hrefs from parser callbacks, "bs4" builds a BeautifulSoup tree
+URL_PATTERN = re.compile(r'https?://[\w\d\-._~:/?#[\]@!$&\'()*+,;=%]+')
+
+
+class _LinkTarget:
+    """
+    lxml parser target: collects the href of every <a> and the xmlUrl of every
+    <outline> as the parser emits start tags, without building a document tree.
+    """
+
+    def __init__(self):
+        self.hrefs = []
+        self.xml_urls = []
+
+    def start(self, tag, attrib):
+        tag = tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ""
+        if tag == "a" and "href" in attrib:
+            self.hrefs.append(attrib["href"])
+        elif tag == "outline" and "xmlUrl" in attrib:
+            self.xml_urls.append(attrib["xmlUrl"])
+
+    def close(self):
+        return self
+
+
+def _stream_links(content, parser_class):
+    target = _LinkTarget()
+    parser = parser_class(target=target, recover=True)
+    try:
+        parser.feed(content)
+        parser.close()
+    except (etree.LxmlError, ValueError):
+        pass  # Keep whatever was collected before the parser gave up
+    return target
 
 class WebsiteRssFeedExtractor:
     DATABASE_PATH = st.secrets["cockroachdb"]["connection_string"]
     RSS_FEED_WEBSITES_TABLE_NAME = st.secrets["cockroachdb"]["website_table_name"]
     RSS_LINKS_TABLE_NAME = st.secrets["cockroachdb"]["rss_links_table_name"]
     
-    def __init__(self, max_depth=3):
+    def __init__(self, max_depth=3, max_workers=CRAWL_WORKERS, per_domain_limit=CRAWL_PER_DOMAIN_LIMIT,
+                 per_domain_interval=CRAWL_PER_DOMAIN_INTERVAL, incremental=True, backend=EXTRACTION_BACKEND,
+                 validate_feeds=True):
   
         self.visited_urls = set()  # To keep track of visited URLs
+        self._visited_lock = threading.Lock()
         self.max_depth = max_depth
+        self.max_workers = max_workers
+        self.domains = DomainLimiter(per_domain_limit, per_domain_interval)
+        self.incremental = incremental
+        self.backend = backend
+        self.validate_feeds = validate_feeds
+        self._crawl_state = {}
+        self._crawl_state_updates = {}
+        self._state_lock = threading.Lock()
+        self.parsed_count = 0
+        self.reused_count = 0
+
+        # One keep-alive session shared by all workers
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _claim_url(self, url):
+        """Mark url as visited, False if it was already visited by any worker."""
+        with self._visited_lock:
+            if url in self.visited_urls:
+                return False
+            self.visited_urls.add(url)
+            return True
 
     @staticmethod
     def _is_valid_url(url):
@@ -29,49 +103,60 @@ class WebsiteRssFeedExtractor:
         parsed_url = requests.utils.urlparse(url)
         return all([parsed_url.scheme, parsed_url.netloc, parsed_url.path])
 
-    def _extract_links_from_text(self, content):
+    def _extract_links_from_text(self, content, known=frozenset()):
+        """RSS links in plain text; links in known (e.g. already found as hrefs) are skipped before validation."""
         rss_links = set()
         # Improved regex pattern that avoids capturing unwanted HTML tags
-        url_pattern = re.compile(
-            r'https?://[\w\d\-._~:/?#[\]@!$&\'()*+,;=%]+')
-        links = re.findall(url_pattern, content)
-        for link in links:
+        for match in URL_PATTERN.finditer(content):
+            link = match.group()
+            if link in known or link in rss_links:
+                continue
             if (link.endswith(('.rss', '.rss.xml', '.xml')) or 'rss' in link or 'feed' in link) and self._is_valid_url(link):
                 rss_links.add(link)
         return rss_links
 
-    def _parse_opml_content(self, content):
+    def _anchor_hrefs(self, html):
+        """href values of all <a> tags, in document order."""
+        if self.backend == "lxml":
+            return _stream_links(html, etree.HTMLParser).hrefs
+        soup = BeautifulSoup(html, 'html.parser')
+        return [link['href'] for link in soup.find_all("a", href=True)]
+
+    def _outline_urls(self, content):
+        """xmlUrl values of all OPML <outline> tags."""
+        if self.backend == "lxml":
+            return _stream_links(content, etree.XMLParser).xml_urls
         soup = BeautifulSoup(content, 'xml')  # Parse the content as XML
+        return [outline['xmlUrl'] for outline in soup.find_all("outline", xmlUrl=True)]
+
+    def _parse_opml_content(self, content):
         rss_links = set()
 
         # Look for <outline> tags with an "xmlUrl" attribute
-        for outline in soup.find_all("outline", xmlUrl=True):
-            rss_link = outline['xmlUrl']
+        for rss_link in self._outline_urls(content):
             if self._is_valid_url(rss_link):  # Validate the URL
                 rss_links.add(rss_link)
         
         return rss_links
 
-    def _parse_for_rss_links(self, html, depth=0):
-        soup = BeautifulSoup(html, 'html.parser')
+    def _parse_for_rss_links(self, html):
+        """Return the RSS links of an HTML page and the resources (.csv, .opml, ...) it links to."""
         rss_links = set()
+        resources = []
 
-        for link in soup.find_all("a", href=True):
-            href = link['href']
+        for href in self._anchor_hrefs(html):
             if (href.endswith(('.rss', '.rss.xml', '.xml')) or 'rss' in href or 'feed' in href) and self._is_valid_url(href):
                 rss_links.add(href)
 
-            # Check for resource type links and recurse if necessary
-            elif any(href.endswith(ext) for ext in ['.csv', '.yml', '.yaml', '.opml', '.txt', '.pdf']):
-                if depth < self.max_depth and href not in self.visited_urls:  # Check if depth is within limit and URL is not visited
-                    self.visited_urls.add(href)
-                    rss_links.update(self.crawl(href, depth + 1))  # Recurse
+            # Resource type links are crawled next, see _crawl_page
+            elif href.endswith(RESOURCE_EXTENSIONS):
+                resources.append(href)
 
-        # Extracting from plain text inside HTML
-        rss_links_from_text = self._extract_links_from_text(html)
+        # Extracting from plain text inside HTML; most matches are the hrefs found above
+        rss_links_from_text = self._extract_links_from_text(html, known=rss_links)
         rss_links.update(rss_links_from_text)
 
-        return rss_links
+        return rss_links, resources
     
     def _parse_csv_content(self, content):
         rss_links = set()
@@ -103,40 +188,148 @@ class WebsiteRssFeedExtractor:
             print("Error parsing the YAML content")
             return set()
 
-    def crawl(self, url=None, depth=0):
-
-        # response = requests.get(url)
-        try:
-            response = requests.get(url, timeout=10)
-        except requests.Timeout:
-            print(f"Timeout for URL: {url}")
-            return set()
-        
-        if response.status_code != 200:
-            print(f"Failed to fetch content from {url}")
-            return set()
-
+    def _parse_document(self, url, response):
+        """Return (rss links, linked resources) of a fetched document."""
         if url.endswith('.csv'):
-            # Note: Assuming you have a method named "_parse_csv_content"
-            return self._parse_csv_content(response.text)
+            return self._parse_csv_content(response.text), []
 
         if url.endswith(('.yml', '.yaml')):
-            # Note: Assuming you have a method named "_parse_yaml_content"
-            return self._parse_yaml_content(response.text)
+            return self._parse_yaml_content(response.text), []
 
         if url.endswith('.opml'):
-            # Note: Assuming you have a method named "_parse_opml_content"
-            return self._parse_opml_content(response.text)
+            return self._parse_opml_content(response.text), []
 
         if url.endswith('.txt'):
-            return self._extract_links_from_text(response.text)
+            return self._extract_links_from_text(response.text), []
 
         if url.endswith('.pdf'):
-            # Note: Assuming you have a method named "_parse_pdf_content"
-            return self._parse_pdf_content(response.content)
+            return self._parse_pdf_content(response.content), []
 
         # If it's none of the above, then parse as HTML
-        return self._parse_for_rss_links(response.text, depth)
+        return self._parse_for_rss_links(response.text)
+
+    def _fetch_links(self, url):
+        """
+        Return (rss links, linked resources) of url. Documents that are unchanged since
+        the last crawl (304 or same content hash) reuse the links stored in crawl_state.
+        """
+        state = self._crawl_state.get(url)
+        headers = {}
+        if state and state[0]:
+            headers["If-None-Match"] = state[0]
+        if state and state[1]:
+            headers["If-Modified-Since"] = state[1]
+
+        try:
+            with self.domains.limit(url):
+                response = self.session.get(url, headers=headers, timeout=10)
+        except requests.Timeout:
+            print(f"Timeout for URL: {url}")
+            return set(), []
+
+        if response.status_code == 304 and state:
+            with self._state_lock:
+                self.reused_count += 1
+            return set(state[3]), list(state[4])
+
+        if response.status_code != 200:
+            print(f"Failed to fetch content from {url}")
+            return set(), []
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        if state and state[2] == content_hash:
+            rss_links, resources = set(state[3]), list(state[4])
+            with self._state_lock:
+                self.reused_count += 1
+        else:
+            rss_links, resources = self._parse_document(url, response)
+            with self._state_lock:
+                self.parsed_count += 1
+
+        with self._state_lock:
+            self._crawl_state_updates[url] = (
+                response.headers.get("ETag"), response.headers.get("Last-Modified"), content_hash,
+                sorted(rss_links), resources
+            )
+        return rss_links, resources
+
+    def _crawl_page(self, url, depth=0):
+        """Fetch one URL, return (rss links, linked resources to crawl at depth + 1)."""
+        rss_links, resources = self._fetch_links(url)
+        # Check if depth is within limit and URL is not visited
+        next_resources = [href for href in resources if depth < self.max_depth and self._claim_url(href)]
+        return rss_links, next_resources
+
+    def _load_crawl_state(self):
+        with get_connection(self.DATABASE_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {CRAWL_STATE_TABLE_NAME} (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                rss_links JSONB,
+                resources JSONB,
+                fetched_at TIMESTAMPTZ DEFAULT now()
+            )
+            ''')
+            conn.commit()
+            cursor.execute(f"SELECT url, etag, last_modified, content_hash, rss_links, resources FROM {CRAWL_STATE_TABLE_NAME}")
+            self._crawl_state = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    def _save_crawl_state(self):
+        with self._state_lock:
+            updates, self._crawl_state_updates = self._crawl_state_updates, {}
+        if not updates:
+            return
+
+        rows = [
+            (url, etag, last_modified, content_hash, psycopg2.extras.Json(rss_links), psycopg2.extras.Json(resources))
+            for url, (etag, last_modified, content_hash, rss_links, resources) in updates.items()
+        ]
+        def upsert(conn):
+            psycopg2.extras.execute_values(conn.cursor(), f'''
+            UPSERT INTO {CRAWL_STATE_TABLE_NAME} (url, etag, last_modified, content_hash, rss_links, resources, fetched_at)
+            VALUES %s
+            ''', rows, template="(%s, %s, %s, %s, %s, %s, now())", page_size=500)
+        run_transaction(self.DATABASE_PATH, upsert)
+
+    def crawl_many(self, urls, depth=0):
+        """
+        Crawl urls and the resources they link to with a pool of workers.
+        Returns {url: RSS links found from it, including its linked resources}.
+        """
+        found = {url: set() for url in urls}
+        self.parsed_count = 0
+        self.reused_count = 0
+        if self.incremental:
+            self._load_crawl_state()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Crawl frontier: future -> (url, depth, seed url it was reached from)
+            pending = {executor.submit(self._crawl_page, url, depth): (url, depth, url) for url in urls}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, page_depth, seed = pending.pop(future)
+                    try:
+                        rss_links, resources = future.result()
+                    except Exception as e:
+                        print(f"Error crawling {url}: {e}")
+                        continue
+
+                    found[seed].update(rss_links)
+                    for resource in resources:
+                        pending[executor.submit(self._crawl_page, resource, page_depth + 1)] = (resource, page_depth + 1, seed)
+
+        if self.incremental:
+            self._save_crawl_state()
+        print(f"Parsed {self.parsed_count} documents, reused the links of {self.reused_count} unchanged documents.")
+        return found
+
+    def crawl(self, url=None, depth=0):
+        return self.crawl_many([url], depth)[url]
 
     def run_crawler(self):
         # Reset counters at the start of a new crawl
@@ -147,7 +340,7 @@ class WebsiteRssFeedExtractor:
         try:
             # Load URLs to be crawled from the database
             print("Connecting to database to fetch websites...")
-            with psycopg2.connect(self.DATABASE_PATH) as conn:
+            with get_connection(self.DATABASE_PATH) as conn:
                 cursor = conn.cursor()
                 cursor.execute(f"SELECT website FROM {self.RSS_FEED_WEBSITES_TABLE_NAME}")
                 urls_to_crawl = [row[0] for row in cursor.fetchall()]
@@ -156,11 +349,10 @@ class WebsiteRssFeedExtractor:
             # For storing the links found during crawling
             all_found_links = set()
 
-            # Crawl each website
-            for website_url in urls_to_crawl:
-                print(f"Crawling website: {website_url}")
-                self.TOTAL_WEBSITES += 1
-                new_links = self.crawl(website_url)
+            # Crawl all websites concurrently
+            print(f"Crawling {len(urls_to_crawl)} websites with {self.max_workers} workers...")
+            self.TOTAL_WEBSITES = len(urls_to_crawl)
+            for website_url, new_links in self.crawl_many(urls_to_crawl).items():
                 all_found_links.update(new_links)
                 print(f"Found {len(new_links)} new links from {website_url}. Total links so far: {len(all_found_links)}")
 
@@ -168,28 +360,20 @@ class WebsiteRssFeedExtractor:
 
             # Save the crawled links to the database and count new links
             print("Checking which links are new...")
-            with psycopg2.connect(self.DATABASE_PATH) as conn:
-                cursor = conn.cursor()
-
-                # Convert the set to a list for indexing
-                all_found_links_list = list(all_found_links)
-
-                # Fetch all links that already exist in the database
-                query = f"SELECT link FROM {self.RSS_LINKS_TABLE_NAME} WHERE link = ANY(%s)"
-                cursor.execute(query, (all_found_links_list,))
-                existing_links = {result[0] for result in cursor.fetchall()}
-
-                # Filter out the links that already exist
-                new_links = [link for link in all_found_links_list if link not in existing_links]
-                self.NEW_LINKS_ADDED = len(new_links)
-
-                # Bulk insert the new links
-                if new_links:
-                    print("Inserting new links to database...")
-                    insert_query = f"INSERT INTO {self.RSS_LINKS_TABLE_NAME} (link) VALUES %s"
-                    psycopg2.extras.execute_values(cursor, insert_query, [(link,) for link in new_links])
-
-                conn.commit()
+            with get_connection(self.DATABASE_PATH) as conn:
+                # Compare by canonical link, so http/https, tracking and FeedBurner variants of a known feed are skipped
+                new_links = list(new_canonical_links(conn.cursor(), sorted(all_found_links), self.RSS_LINKS_TABLE_NAME).values())
+
+            # The connection is back in the pool before the network-bound validation starts
+            if self.validate_feeds:
+                # Only verified feeds are stored, see RssFeedValidator
+                self.NEW_LINKS_ADDED = validate_candidates(self.DATABASE_PATH, new_links, self.RSS_LINKS_TABLE_NAME)
+
+            # Bulk insert the new links
+            elif new_links:
+                print("Inserting new links to database...")
+                inserted = run_transaction(self.DATABASE_PATH, lambda conn: insert_links(conn.cursor(), new_links, self.RSS_LINKS_TABLE_NAME))
+                self.NEW_LINKS_ADDED = len(inserted)
             print(f"Finished saving links to database. Total new links added: {self.NEW_LINKS_ADDED}")
 
         except Exception as e:
@@ -198,7 +382,7 @@ class WebsiteRssFeedExtractor:
 
 
     def add_to_database(self, url):
-        with psycopg2.connect(self.DATABASE_PATH) as conn:
+        with get_connection(self.DATABASE_PATH) as conn:
             cursor = conn.cursor()
             print(f"Starting crawl for URL: {url}")
             cursor.execute(f"INSERT INTO {self.RSS_FEED_WEBSITES_TABLE_NAME} (website) VALUES (%s) ON CONFLICT (website) DO NOTHING", (url,))
@@ -214,14 +398,16 @@ class WebsiteRssFeedExtractor:
             for url in urls:
                 self.add_to_database(url)
 
+        # Fill canonical_link for existing rows and merge duplicates before anything is inserted
+        merge_duplicate_links(self.DATABASE_PATH)
+
         if rss_links:
-            for link in rss_links:
-                print("inserting RSS LINKS directly")
-                # If the URL is an RSS link, directly add it to the RSS links database
-                with psycopg2.connect(self.DATABASE_PATH) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(f"INSERT INTO {self.RSS_LINKS_TABLE_NAME} (link) VALUES (%s) ON CONFLICT (link) DO NOTHING", (link,))
-                    conn.commit()
+            print("inserting RSS LINKS directly")
+            # RSS links are added directly to the RSS links database
+            with get_connection(self.DATABASE_PATH) as conn:
+                inserted = insert_links(conn.cursor(), rss_links, self.RSS_LINKS_TABLE_NAME)
+                conn.commit()
+            print(f"Inserted {len(inserted)} of {len(rss_links)} configured RSS links")
 
         self.run_crawler()
         # conn.close()
@@ -0,0 +1,72 @@
+import psycopg2.extras
+from RssDbPool import get_connection, run_transaction
+
+BATCH_SIZE = 500  # Rows pulled, processed and committed together
+
+
+class WorkQueue:
+    """
+    Streams the unprocessed rows of a table in rowid order, one batch at a time.
+
+    Every batch is read with a keyset query (rowid > last rowid), handed to a
+    process function that returns the parameters for update_query, and written
+    back in its own transaction. Memory stays at one batch and a crash loses at
+    most the batch in flight; rows that stay unprocessed (e.g. a failed API call)
+    are not fetched again in the same run.
+    """
+
+    def __init__(self, database, table_name, columns, where_clause, update_query, params=(), batch_size=BATCH_SIZE):
+        self.database = database
+        self.table_name = table_name
+        self.columns = columns
+        self.where_clause = where_clause
+        self.update_query = update_query
+        self.params = list(params)
+        self.batch_size = batch_size
+
+    def _fetch_batch(self, last_rowid):
+        keyset = "" if last_rowid is None else "rowid > %s AND "
+        keyset_params = [] if last_rowid is None else [last_rowid]
+        with get_connection(self.database) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+            SELECT rowid, {", ".join(self.columns)} FROM {self.table_name}
+            WHERE {keyset}({self.where_clause})
+            ORDER BY rowid
+            LIMIT %s
+            ''', keyset_params + self.params + [self.batch_size])
+            return cursor.fetchall()
+
+    def batches(self):
+        """Yield lists of (rowid, *columns) rows until the queue is drained."""
+        last_rowid = None
+        while True:
+            rows = self._fetch_batch(last_rowid)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < self.batch_size:
+                return
+            last_rowid = rows[-1][0]
+
+    def _write(self, updates):
+        def update(conn):
+            psycopg2.extras.execute_batch(conn.cursor(), self.update_query, updates)
+        run_transaction(self.database, update)
+
+    def run(self, process_batch, increment_func=None):
+        """
+        Call process_batch(rows) for every batch and write the update parameters it
+        returns. Returns the number of rows processed.
+        """
+        processed = 0
+        for rows in self.batches():
+            updates = process_batch(rows)
+            if updates:
+                self._write(updates)
+            processed += len(rows)
+
+            if increment_func:
+                for _ in rows:
+                    increment_func()
+        return processed
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+
+from RssWebFeedExtractor import WebsiteRssFeedExtractor
+
+# Compares the bs4 and lxml link extraction backends of WebsiteRssFeedExtractor on
+# a directory of saved documents (.html pages and .opml collections):
+#     python extraction_backend_benchmark.py saved_documents/
+# HTML timings are for the whole shipped path: anchor extraction plus the plain-text
+# URL search that runs after it; the share of the text search is printed separately.
+
+REPEAT = 3
+
+
+def extract(extractor, path, content):
+    if path.endswith('.opml'):
+        return extractor._parse_opml_content(content), []
+    return extractor._parse_for_rss_links(content)
+
+
+def compare_backends(directory, repeat=REPEAT):
+    extractors = {backend: WebsiteRssFeedExtractor(backend=backend, incremental=False) for backend in ("bs4", "lxml")}
+    totals = {backend: 0.0 for backend in extractors}
+
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        with open(path, encoding="utf-8", errors="replace") as file:
+            content = file.read()
+
+        results = {}
+        for backend, extractor in extractors.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                results[backend] = extract(extractor, path, content)
+            elapsed = (time.perf_counter() - start) / repeat
+            totals[backend] += elapsed
+
+            text_search = ""
+            if not path.endswith('.opml'):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    extractor._extract_links_from_text(content, known=results[backend][0])
+                text_search = f"  (text search {(time.perf_counter() - start) / repeat * 1000:.1f} ms)"
+            print(f"{name:40} {backend:5} {elapsed * 1000:9.1f} ms  {len(results[backend][0])} links, "
+                  f"{len(results[backend][1])} resources{text_search}")
+
+        (bs4_links, bs4_resources), (lxml_links, lxml_resources) = results["bs4"], results["lxml"]
+        if bs4_links != lxml_links or bs4_resources != lxml_resources:
+            print(f"{name:40} differs: {len(bs4_links ^ lxml_links)} links, "
+                  f"{len(set(bs4_resources) ^ set(lxml_resources))} resources")
+
+    print(f"Total: bs4 {totals['bs4']:.2f} s, lxml {totals['lxml']:.2f} s")
+
+
+if __name__ == "__main__":
+    compare_backends(sys.argv[1] if len(sys.argv) > 1 else "saved_documents")
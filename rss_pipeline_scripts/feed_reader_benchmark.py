@@ -0,0 +1,114 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import RssEntryReader
+from RssEntryReader import AsyncRSSReader, RSSReader
+
+# Compares the threaded reader with AsyncRSSReader on stand-in feeds served from
+# local servers, without a database:
+#     python feed_reader_benchmark.py [number of feeds]
+# Every feed answers after LATENCY seconds, like a remote server would. The feeds
+# are spread over HOSTS servers on their own ports, so the per-host limits apply
+# as they would to real publishers. Stored entries, validators and poll results
+# are kept in memory.
+
+FEEDS = 2000
+HOSTS = 20
+LATENCY = 0.1  # Seconds before a feed server answers
+ENTRIES_PER_FEED = 10
+
+
+def feed_document(number):
+    published = formatdate(time.time() - 600, usegmt=True)
+    items = "".join(f"<item><title>Story {number}-{i}</title><link>https://news.example.com/{number}/{i}</link>"
+                    f"<pubDate>{published}</pubDate></item>" for i in range(ENTRIES_PER_FEED))
+    return (f'<?xml version="1.0"?><rss version="2.0"><channel><title>Publisher {number}</title>'
+            f"<language>en</language>{items}</channel></rss>").encode()
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(LATENCY)
+        body = feed_document(int(self.path.rsplit("/", 1)[-1]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FeedServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def start_servers(hosts=HOSTS):
+    servers = [FeedServer(("127.0.0.1", 0), FeedHandler) for _ in range(hosts)]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return servers
+
+
+class MemoryStore:
+    """Replaces the database methods of RSSReader and the scheduler update for the run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.links = set()
+
+    def install(self):
+        store = self
+        RSSReader.create_table_for_run = lambda self: "rss_entries"
+        RSSReader._load_feed_cache = lambda self, rss_links: {}
+        RSSReader._save_feed_cache = lambda self, cache_updates: None
+        RSSReader._store_entries = lambda self, entries, table_name: store.add(entries)
+        RssEntryReader.record_poll_results = lambda database, results, window_hours: None
+
+    def add(self, entries):
+        with self.lock:
+            before = len(self.links)
+            self.links.update(entry[2] for entry in entries)
+            return len(self.links) - before
+
+
+def run_threaded(rss_links):
+    """The threaded mode of run_rss_reader: chunks of CHUNK_SIZE links on a ThreadPoolExecutor."""
+    chunks = [rss_links[i:i + RssEntryReader.CHUNK_SIZE] for i in range(0, len(rss_links), RssEntryReader.CHUNK_SIZE)]
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(RssEntryReader.fetch_rss_data_chunk, chunks))
+
+
+def run_async(rss_links):
+    reader = AsyncRSSReader("benchmark", days_to_crawl=RssEntryReader.DAYS_TO_CRAWL,
+                            max_in_flight=RssEntryReader.MAX_IN_FLIGHT, per_host_limit=RssEntryReader.PER_HOST_LIMIT)
+    reader.start(rss_links)
+
+
+def compare_readers(feeds=FEEDS):
+    servers = start_servers()
+    rss_links = [f"http://127.0.0.1:{servers[i % len(servers)].server_port}/feed/{i}" for i in range(feeds)]
+    results = {}
+
+    for mode, run in (("threaded", run_threaded), ("async", run_async)):
+        store = MemoryStore()
+        store.install()
+        start = time.perf_counter()
+        run(rss_links)
+        results[mode] = time.perf_counter() - start
+        print(f"{mode:8} {results[mode]:7.2f} s  {feeds / results[mode]:7.1f} feeds/s  {len(store.links)} entries")
+
+    for server in servers:
+        server.shutdown()
+    print(f"{feeds} feeds on {len(servers)} hosts, {LATENCY * 1000:.0f} ms latency: "
+          f"async is {results['threaded'] / results['async']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    compare_readers(int(sys.argv[1]) if len(sys.argv) > 1 else FEEDS)
@@ -1,13 +1,7 @@
 import json
 import streamlit as st
-from RssWebFeedExtractor import WebsiteRssFeedExtractor
-from RssEntryReader import run_rss_reader
-from RssEntryClassifier import classify_titles_from_db
-from RssEntrySentiment import classify_sentiments_in_db
-from RssOpenAiAnalyser import analyze_titles_in_cockroachdb
-
-from RssGenerateTweets import fetch_high_importance_entries
-from RssAiLanguageDetect import classify_titles_language_from_db
+# Pipeline steps are imported inside main_pipeline, so only the enabled steps
+# pay for their imports (torch, transformers, ...) and models.
 # from RssHuggingfacesAiAnalyser import analyze_titles_in_cockroachdb
 
 DATABASE_PATH = st.secrets["cockroachdb"]["connection_string"]
@@ -23,30 +17,48 @@ def main_pipeline():
     ANALYSIS_COLUMN_NAME = config["params"]["ANALYSIS_COLUMN_NAME_BASE"] + config["suffixes"]["ANALYSIS_COLUMN_NAME"]
     TWEET_COLUMN_NAME = config["params"]["ANALYSIS_COLUMN_NAME_BASE"] + config["suffixes"]["TWEET_COLUMN_NAME"]
     
+    # Typed timestamps, stable ids and indexes on rss_entries (idempotent)
+    if config["steps"].get("migrate_schema"):
+        from RssSchemaMigration import migrate_entries_schema
+        migrate_entries_schema(DATABASE_PATH, status_columns=[ANALYSIS_COLUMN_NAME, TWEET_COLUMN_NAME])
+
     # RSS Feed Extraction
     if config["steps"]["extract"]:
+        from RssWebFeedExtractor import WebsiteRssFeedExtractor
         extractor = WebsiteRssFeedExtractor(max_depth=2)
         extractor.start_crawler(config["params"]["URLS"], config["params"]["RSS_LINKS"])
         print("extraction completed")
     
     # RSS Reader Execution
     if config["steps"]["read"]:
+        from RssEntryReader import run_rss_reader
         run_rss_reader()
 
     if config["steps"]["classify_language"]:
+        from RssAiLanguageDetect import classify_titles_language_from_db
         classify_titles_language_from_db(DATABASE_PATH)
     
     # Classify Titles
     if config["steps"]["classify_titles"]:
+        from RssEntryClassifier import classify_titles_from_db
         threshold = float(config["params"]["DEFAULT_THRESHOLD"])
         classify_titles_from_db(DATABASE_PATH, classes=config["params"]["DEFAULT_CLASSES"], threshold=threshold)
     
+    # Cluster near-duplicate titles, so only one entry per story is analyzed
+    if config["steps"].get("cluster_titles"):
+        from RssTitleClustering import cluster_titles_in_db
+        cluster_titles_in_db(DATABASE_PATH,
+                             threshold=float(config["params"]["CLUSTER_THRESHOLD"]),
+                             window_hours=float(config["params"]["CLUSTER_WINDOW_HOURS"]))
+
     # Classify Sentiments
     if config["steps"]["classify_sentiments"]:
+        from RssEntrySentiment import classify_sentiments_in_db
         classify_sentiments_in_db(DATABASE_PATH)
     
     # Analyze Titles
     if config["steps"]["analyze_titles"]:
+        from RssOpenAiAnalyser import analyze_titles_in_cockroachdb
         analyze_titles_in_cockroachdb(DATABASE_PATH, 
                                       custom_instruction=config["params"]["ANALYSIS_INSTRUCTION"], 
                                       column_name=ANALYSIS_COLUMN_NAME, 
@@ -55,6 +67,7 @@ def main_pipeline():
     
     # Fetch and Print High Importance Entries create tweets
     if config["steps"]["fetch_and_print"]:
+        from RssGenerateTweets import fetch_high_importance_entries
         fetch_high_importance_entries(DATABASE_PATH, config["params"]["TWEET_INSTRUCTION"], TWEET_COLUMN_NAME, ANALYSIS_COLUMN_NAME)
 
 
@@ -9,6 +9,7 @@ from supabase import create_client, Client
 import json
 import psycopg2
 import uuid
+from RssAnalysisStore import ANALYSIS_TABLE
 
 
 import base64
@@ -199,7 +200,7 @@ def fetch_generated_tweets_from_db(db_params, days_back, selected_class):
         cursor = conn.cursor()
 
         # Calculate the date x days back from today
-        past_date = (datetime.datetime.now() - datetime.timedelta(days=days_back)).strftime('%Y-%m-%d')
+        past_date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days_back)
         
         # Fetch table names with the prefix "rss_entries_"
         cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_name LIKE 'rss_entries';")
@@ -212,27 +213,26 @@ def fetch_generated_tweets_from_db(db_params, days_back, selected_class):
             table_name = table[0]
             
             # Construct WHERE clause for date filtering and optional class filtering
-            where_clauses = [f"published >= '{past_date}'"]
+            where_clauses = ["published_at >= %s"]
+            params = [ANALYSIS_COLUMN_NAME, past_date]
             if selected_class != "All Classes":
-                where_clauses.append(f"class = '{selected_class}'")
+                where_clauses.append("class = %s")
+                params.append(selected_class)
 
             where_clause = " AND ".join(where_clauses)
 
-            # Fetch generated_tweet, link, title, published_date, publisher, class, and ANALYSIS_COLUMN_NAME
-            cursor.execute(f"SELECT title, link, class, \"{TWEET_COLUMN_NAME}\", published, publisher, \"{ANALYSIS_COLUMN_NAME}\" FROM {table_name} WHERE {where_clause};")
+            # Fetch generated_tweet, link, title, published_date, publisher, class and the parsed reason
+            cursor.execute(f'''
+            SELECT title, link, class, "{TWEET_COLUMN_NAME}", published, publisher, a.reason, published_at
+            FROM {table_name} e
+            LEFT JOIN {ANALYSIS_TABLE} a ON a.entry_rowid = e.rowid AND a.profile = %s
+            WHERE {where_clause};
+            ''', params)
             entries = cursor.fetchall()
 
             for entry in entries:
-                title, link, tweet_class, tweet, published_date, publisher, analysis_data = entry
-
-                # Extract reason from the analysis_data
-                try:
-                    outer_json = json.loads(analysis_data)
-                    inner_json_str = outer_json.get("content", "{}")
-                    inner_json = json.loads(inner_json_str)
-                    reason = inner_json.get("Reason", "Unknown Reason")
-                except:
-                    reason = "Error decoding reason"
+                title, link, tweet_class, tweet, published_date, publisher, reason, published_at = entry
+                reason = reason or "Unknown Reason"
 
                 tweets_data.append({
                     "title": title,
@@ -240,6 +240,7 @@ def fetch_generated_tweets_from_db(db_params, days_back, selected_class):
                     "class": tweet_class,
                     "tweet": tweet,
                     "published": published_date,
+                    "published_at": published_at,
                     "publisher": publisher,
                     "reason": reason
                 })
@@ -282,8 +283,8 @@ def post_instant_tweet(api_key, api_secret, access_token, access_token_secret, c
 # Assuming the 'published_date' is a field in the 'tweets_data' returned by the database
 # If it's named differently, please adjust accordingly
 
-# Sort tweets_data by 'published' in descending order
-tweets_data = sorted(tweets_data, key=lambda x: x.get('published', ''), reverse=True)
+# Sort tweets_data by 'published_at' in descending order
+tweets_data = sorted(tweets_data, key=lambda x: x['published_at'], reverse=True)
 
 for data in tweets_data:
 
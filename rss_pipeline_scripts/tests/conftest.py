@@ -0,0 +1,55 @@
+import os
+import sys
+from contextlib import contextmanager
+
+from streamlit import config
+
+# The pipeline modules read st.secrets at import time; the example secrets are
+# enough for everything the tests touch, which never connects to a database.
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+config.set_option("secrets.files", [os.path.join(SCRIPTS_DIR, ".streamlit", "secrets_example.toml")])
+
+from RssSchemaMigration import ROWID_EPOCH  # noqa: E402
+
+
+def make_rowid(moment, node_id=1):
+    """What CockroachDB's unique_rowid() returns for a row written at moment."""
+    return (round((moment.timestamp() - ROWID_EPOCH) * 100000) << 15) | node_id
+
+
+class FakeCursor:
+    """
+    Stand-in for a psycopg2 connection and its cursor. Each execute answers with the
+    next of results: a list of rows, or a function of the query parameters returning
+    them, which plays the part of the WHERE clause. The parameters of every execute
+    are kept in params; the SQL text is not looked at.
+    """
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.params = []
+        self.rows = []
+        self.connection = self
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def execute(self, query, params=None):
+        self.params.append(params)
+        result = self.results.pop(0) if self.results else []
+        self.rows = list(result(params) if callable(result) else result)
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    @contextmanager
+    def get_connection(self, database):
+        """Replacement for RssDbPool.get_connection that hands out this cursor."""
+        yield self
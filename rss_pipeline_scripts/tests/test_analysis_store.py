@@ -0,0 +1,9 @@
+import json
+
+from RssAnalysisStore import parse_analysis
+
+
+def test_parse_analysis():
+    message = json.dumps({"role": "assistant", "content": json.dumps({"Importance": " High", "Sentiment": "Neutral", "Reason": "Rate decision"})})
+    assert parse_analysis(message)[:3] == ("high", "neutral", "Rate decision")
+    assert parse_analysis("not json")[0] == "unknown"
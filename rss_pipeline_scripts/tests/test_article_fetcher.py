@@ -0,0 +1,63 @@
+import requests
+
+from RssArticleFetcher import ArticleCache, ArticleFetcher
+
+ARTICLE_HTML = """<html><head><title>Rates held</title></head><body><article>
+<h1>Central bank holds rates</h1>
+<p>The central bank kept its key interest rate unchanged on Tuesday, citing slowing inflation and a cooling labour market.</p>
+<p>Economists had widely expected the decision, and markets barely moved after the announcement was published.</p>
+</article></body></html>"""
+
+
+class StaticSession:
+    """requests.Session stand-in that answers every GET with one fixed response."""
+
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append((url, headers))
+        response = requests.Response()
+        response.status_code = self.status_code
+        response._content = self.text.encode("utf-8")
+        response.encoding = "utf-8"
+        response.headers.update(self.headers)
+        response.url = url
+        return response
+
+
+def make_fetcher(tmp_path, session):
+    fetcher = ArticleFetcher(cache=ArticleCache(str(tmp_path / "article_cache.sqlite3")), per_domain_interval=0)
+    fetcher._session = lambda: session
+    return fetcher
+
+
+def test_fetch_returns_none_for_404_and_does_not_cache(tmp_path):
+    link = "https://news.example.com/missing"
+    fetcher = make_fetcher(tmp_path, StaticSession(404, "<html><body><p>Page not found</p></body></html>"))
+
+    assert fetcher.fetch(link) is None
+    assert fetcher.cache.get(link) is None
+    assert fetcher.failures == 1 and fetcher.downloads == 0
+
+
+def test_fetch_returns_none_for_429(tmp_path):
+    fetcher = make_fetcher(tmp_path, StaticSession(429, "Too Many Requests", {"Retry-After": "120"}))
+    assert fetcher.fetch("https://news.example.com/busy") is None
+
+
+def test_fetch_parses_and_caches_200(tmp_path):
+    link = "https://news.example.com/rates"
+    session = StaticSession(200, ARTICLE_HTML, {"ETag": '"v1"'})
+    fetcher = make_fetcher(tmp_path, session)
+
+    text = fetcher.fetch(link)
+    assert "kept its key interest rate unchanged" in text
+    assert fetcher.cache.get(link)[:3] == ('"v1"', None, text)
+
+    # Fresh cache entries are served without another request
+    assert fetcher.fetch(link) == text
+    assert len(session.requests) == 1
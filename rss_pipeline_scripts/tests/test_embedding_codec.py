@@ -0,0 +1,19 @@
+import numpy as np
+
+from RssEmbeddingCodec import convert_legacy_rows, decode_embedding, encode_embedding
+
+
+def test_encode_decode_round_trip():
+    vector = np.array([0.25, -1.5, 3.0], dtype=np.float32)
+    assert np.allclose(decode_embedding(encode_embedding(vector)), vector)
+    assert np.allclose(decode_embedding("[0.25, -1.5, 3.0]"), vector)
+
+
+def test_convert_legacy_rows_skips_malformed_embeddings():
+    rows = [(1, "[0.5, 1.0]"), (2, "[0.5, 1.0, 0.2"), (3, "not json"), (5, '{"a": 1}'), (4, "[1.0, 0.0]")]
+    updates, malformed = convert_legacy_rows(rows)
+
+    assert malformed == [2, 3, 5]
+    assert [rowid for _, rowid in updates] == [1, 2, 3, 5, 4]
+    assert [embedding_bin for embedding_bin, rowid in updates if rowid in malformed] == [None, None, None]
+    assert np.allclose(decode_embedding(updates[0][0].adapted), [0.5, 1.0])
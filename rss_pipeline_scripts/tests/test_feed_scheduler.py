@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+
+from RssFeedScheduler import CHANGED, FAILED, MIN_POLL_INTERVAL, UNCHANGED, next_schedule
+
+NOW = datetime(2024, 5, 1, tzinfo=timezone.utc)
+DAILY_WINDOW = 24
+
+
+def test_intervals_stay_inside_the_crawl_window():
+    longest = DAILY_WINDOW * 3600 - MIN_POLL_INTERVAL
+    # About one entry a day would ask for a 72 hour interval
+    rare = next_schedule((None, None, 0, None), CHANGED, 1, DAILY_WINDOW, NOW)
+    backed_off = next_schedule((longest, 0.0, 0, None), UNCHANGED, 0, DAILY_WINDOW, NOW)
+    failing = next_schedule((None, None, 8, None), FAILED, 0, DAILY_WINDOW, NOW)
+
+    assert rare[0] == backed_off[0] == failing[0] == longest
+    assert failing[2] == 9
+
+
+def test_busy_feeds_are_polled_every_run():
+    interval, rate, *_ = next_schedule((None, None, 0, None), CHANGED, 240, DAILY_WINDOW, NOW)
+    assert interval == MIN_POLL_INTERVAL
+    assert rate == 10
@@ -0,0 +1,110 @@
+import socket
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import RssWebFeedExtractor
+from conftest import FakeCursor
+from RssFeedValidator import FeedValidator, root_element
+from RssWebFeedExtractor import WebsiteRssFeedExtractor
+
+RSS = b'<?xml version="1.0"?><rss version="2.0"><channel><title>News</title></channel></rss>'
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    dead_port = None
+
+    def do_GET(self):
+        pages = {
+            "/feed.xml": (200, "application/rss+xml", RSS),
+            "/blog": (200, "text/html", self._page("/feed.xml")),
+            "/broken-announcement": (200, "text/html", self._page("/missing.xml")),
+            "/unreachable-announcement": (200, "text/html",
+                                          self._page(f"http://127.0.0.1:{self.dead_port}/feed.xml")),
+            "/about": (200, "text/html", b"<html><head><title>About</title></head><body>About us</body></html>"),
+        }
+        status, content_type, body = pages.get(self.path, (404, "text/html", b"<html>Not found</html>"))
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _page(feed_href):
+        return (f'<html><head><link rel="alternate" type="application/rss+xml" href="{feed_href}">'
+                f'</head><body>Blog</body></html>').encode()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    SiteHandler.dead_port = unused_port()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_root_element_skips_prolog():
+    assert root_element(b'\xef\xbb\xbf<?xml version="1.0"?>\n<!-- c --><rdf:RDF xmlns:rdf="x">') == "rdf"
+
+
+def test_outcomes_are_recorded_against_the_candidate(site):
+    validator = FeedValidator(per_domain_interval=0)
+    candidates = [f"{site}/feed.xml", f"{site}/blog", f"{site}/broken-announcement",
+                  f"{site}/unreachable-announcement", f"{site}/about"]
+
+    results = validator.validate_many(candidates)
+
+    assert results == {
+        f"{site}/feed.xml": f"{site}/feed.xml",
+        f"{site}/blog": f"{site}/feed.xml",
+        f"{site}/broken-announcement": None,
+        f"{site}/unreachable-announcement": None,
+        f"{site}/about": None,
+    }
+    # One count per candidate: the autodiscovered feeds are not counted themselves
+    assert validator.stats == {"feeds": 2, "discovered": 1, "rejected": 2, "failed": 1}
+    assert validator.unreachable == {f"{site}/unreachable-announcement"}
+
+
+def test_run_crawler_releases_its_connection_before_validating(monkeypatch):
+    open_connections = []
+
+    @contextmanager
+    def get_connection(database):
+        open_connections.append(1)
+        try:
+            yield FakeCursor()
+        finally:
+            open_connections.pop()
+
+    validated = []
+
+    def validate_candidates(database, candidates, table_name):
+        # With pool_max_size=1 a connection still checked out here would deadlock
+        assert not open_connections
+        validated.extend(candidates)
+        return len(candidates)
+
+    extractor = WebsiteRssFeedExtractor(incremental=False)
+    monkeypatch.setattr(RssWebFeedExtractor, "get_connection", get_connection)
+    monkeypatch.setattr(RssWebFeedExtractor, "validate_candidates", validate_candidates)
+    monkeypatch.setattr(extractor, "crawl_many", lambda urls: {"https://seed.example.com": {"https://a.example.com/feed"}})
+
+    extractor.run_crawler()
+
+    assert validated == ["https://a.example.com/feed"]
+    assert extractor.NEW_LINKS_ADDED == 1
@@ -0,0 +1,70 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+
+import RssLlmCache
+import RssOpenAiAnalyser
+from RssRateLimiter import RateLimiter
+
+
+class MockOpenAiHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible chat completions: rejects "oversized" titles, rate limits "busy" ones once."""
+
+    rate_limited = set()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        title = body["messages"][-1]["content"]
+
+        if title.startswith("oversized"):
+            self._reply(400, {"error": {"message": "maximum context length exceeded", "type": "invalid_request_error"}})
+        elif title.startswith("busy") and title not in self.rate_limited:
+            self.rate_limited.add(title)
+            self._reply(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"Retry-After": "0"})
+        else:
+            self._reply(200, {
+                "id": "chatcmpl-mock", "object": "chat.completion", "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": json.dumps({"importance": "low", "title": title})}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+            })
+
+    def _reply(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mock_openai(monkeypatch, tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockOpenAiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(openai, "api_base", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setattr(RssLlmCache, "_cache", RssLlmCache.LlmCache(path=str(tmp_path / "llm_cache.sqlite3")))
+    yield
+    server.shutdown()
+    server.server_close()
+
+
+def test_analyze_batch_keeps_results_when_one_title_fails(mock_openai):
+    rows = [(1, "first headline"), (2, "oversized headline"), (3, "busy headline"), (4, "first headline")]
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=100000)
+
+    updates = RssOpenAiAnalyser.analyze_batch(rows, "Rate the importance.", limiter, max_workers=4)
+
+    assert sorted(title for _, title in updates) == ["busy headline", "first headline"]
+    assert limiter.rate_limited_count == 1
+    for analysis, title in updates:
+        assert json.loads(json.loads(analysis)["content"])["title"] == title
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta, timezone
+
+import RssSchemaMigration
+from conftest import FakeCursor, make_rowid
+from RssSchemaMigration import ROWID_EPOCH, inserted_at_updates, inserted_since, migrate_entries_schema, rowid_to_datetime
+
+
+def test_rowid_epoch_is_2015():
+    assert datetime.fromtimestamp(ROWID_EPOCH, tz=timezone.utc) == datetime(2015, 1, 1, tzinfo=timezone.utc)
+
+
+def test_inserted_at_updates_of_realistic_rowid():
+    # unique_rowid() of a row written on node 1 at 2024-03-12 09:15 UTC;
+    # decoded from 1970 instead of 2015 it would land in 1981
+    rowid = 950811033600000001
+    assert inserted_at_updates([(rowid, None)]) == [(datetime(2024, 3, 12, 9, 15, tzinfo=timezone.utc), rowid)]
+
+
+def test_rowid_to_datetime_round_trip():
+    moment = datetime(2025, 6, 1, 12, 30, tzinfo=timezone.utc)
+    assert abs(rowid_to_datetime(make_rowid(moment, node_id=7)) - moment) < timedelta(milliseconds=1)
+
+
+def test_inserted_since_window_contains_recent_rowids():
+    now = datetime.now(timezone.utc)
+    bound = inserted_since(48)
+    assert rowid_to_datetime(make_rowid(now - timedelta(hours=1))) >= bound
+    assert rowid_to_datetime(make_rowid(now - timedelta(hours=49))) < bound
+
+
+def test_migration_skips_a_database_without_entries_table(monkeypatch):
+    conn = FakeCursor([])  # information_schema.tables has no rss_entries yet
+    monkeypatch.setattr(RssSchemaMigration, "get_connection", conn.get_connection)
+    backfilled = []
+    monkeypatch.setattr(RssSchemaMigration, "backfill_inserted_at", lambda *args: backfilled.append(args))
+
+    migrate_entries_schema("crdb")
+    assert conn.params == [("rss_entries",)]
+    assert backfilled == []
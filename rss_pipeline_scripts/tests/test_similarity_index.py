@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from conftest import FakeCursor, make_rowid
+from RssEmbeddingCodec import encode_embedding
+from RssSchemaMigration import rowid_to_datetime
+from RssSimilarityIndex import SimilarityIndex, load_scheduled_embeddings
+
+
+def test_load_scheduled_embeddings_preloads_recent_tweets():
+    now = datetime.now(timezone.utc)
+    recent, old = np.array([1.0, 0.0, 0.0]), np.array([0.0, 1.0, 0.0])
+    # inserted_at as backfilled from the rows' rowids
+    rows = [
+        (rowid_to_datetime(make_rowid(now - timedelta(days=1), node_id=3)), encode_embedding(recent)),
+        (rowid_to_datetime(make_rowid(now - timedelta(days=10), node_id=2)), encode_embedding(old)),
+    ]
+    cursor = FakeCursor(lambda params: [(embedding_bin, None) for inserted_at, embedding_bin in rows
+                                        if inserted_at >= params[0]])
+    index = SimilarityIndex()
+    load_scheduled_embeddings(cursor, index, history_days=7)
+
+    assert len(index) == 1
+    assert index.is_similar(SimilarityIndex.normalize(recent))
+    assert not index.is_similar(SimilarityIndex.normalize(old))
+
+
+def test_select_unique_skips_candidates_similar_to_index_or_each_other():
+    index = SimilarityIndex()
+    index.add(SimilarityIndex.normalize([1.0, 0.0]))
+    candidates = [SimilarityIndex.normalize(v) for v in ([0.99, 0.05], [0.0, 1.0], [0.05, 0.99], [])]
+    assert index.select_unique(candidates, threshold=0.8) == [1, 3]
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import psycopg2.extras
+
+import RssTitleClustering
+from conftest import FakeCursor, make_rowid
+from RssEmbeddingCodec import encode_embedding
+from RssSchemaMigration import rowid_to_datetime
+from RssTitleClustering import assign_clusters, cluster_titles_in_db
+
+
+def test_cluster_titles_in_db_selects_entries_of_the_window(monkeypatch):
+    now = datetime.now(timezone.utc)
+    story, other = [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]
+    first, repost, unrelated, stale = (make_rowid(now - timedelta(hours=h), node_id=n)
+                                      for h, n in ((3, 1), (2, 2), (1, 1), (72, 1)))
+    rows = sorted([
+        (first, encode_embedding(story)),
+        (repost, encode_embedding(story)),
+        (unrelated, encode_embedding(other)),
+        (stale, encode_embedding(story)),
+    ])
+    # Two ALTERs for the cluster columns, then the window query; inserted_at as backfilled from the rowid
+    conn = FakeCursor([], [], lambda params: [(rowid, None, None, embedding, None) for rowid, embedding in rows
+                                             if rowid_to_datetime(rowid) >= params[0]])
+    written = []
+
+    monkeypatch.setattr(RssTitleClustering, "get_connection", conn.get_connection)
+    monkeypatch.setattr(RssTitleClustering, "run_transaction", lambda database, func: func(conn))
+    monkeypatch.setattr(psycopg2.extras, "execute_batch", lambda cursor, query, args, page_size: written.extend(args))
+
+    assert cluster_titles_in_db("crdb", window_hours=48) == 3
+    assert sorted(written, key=lambda update: update[2]) == [
+        (first, True, first), (first, False, repost), (unrelated, True, unrelated)]
+
+
+def test_assign_clusters_joins_existing_seed():
+    embeddings = np.array([[1.0, 0.0], [0.0, 1.0]])
+    assignments = assign_clusters([10, 11], embeddings, threshold=0.9, seeds=[(5, np.array([0.99, 0.01]))])
+    assert assignments == {10: (5, False), 11: (11, True)}
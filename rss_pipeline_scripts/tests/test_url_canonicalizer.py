@@ -0,0 +1,85 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import RssUrlCanonicalizer
+from conftest import FakeCursor
+from RssUrlCanonicalizer import MERGED_COLUMNS, canonicalize_url, insert_links, merge_duplicate_links, merge_link_state
+
+
+def row(link, **state):
+    values = dict.fromkeys(MERGED_COLUMNS)
+    values.update(link=link, dead_link=False, failure_count=0)
+    values.update(state)
+    return values
+
+
+@pytest.mark.parametrize("url, canonical", [
+    ("HTTP://Example.COM:80/feed/", "https://example.com/feed"),
+    ("https://example.com/feed?utm_source=x&b=2&a=1#top", "https://example.com/feed?a=1&b=2"),
+    ("http://feeds.feedburner.com/TechCrunch?format=xml", "https://feeds.feedburner.com/techcrunch"),
+    ("https://feedproxy.google.com/techcrunch/", "https://feeds.feedburner.com/techcrunch"),
+    ("https://Ex.com:8443/a/", "https://ex.com:8443/a"),
+    ("example.com/rss", "example.com/rss"),
+])
+def test_canonicalize_url(url, canonical):
+    assert canonicalize_url(url) == canonical
+
+
+def test_merge_keeps_cache_and_schedule_state_of_duplicates():
+    polled = datetime(2026, 10, 1, 12, tzinfo=timezone.utc)
+    kept = row("https://example.com/feed")  # Added by the crawler, never polled
+    duplicate = row("http://example.com/feed/", etag='"abc"', last_modified="Wed, 01 Oct 2026 11:00:00 GMT",
+                    content_hash="f00d", last_polled_at=polled, last_changed_at=polled, entry_rate=2.5,
+                    poll_interval=3600, next_due_at=datetime(2026, 10, 1, 13, tzinfo=timezone.utc))
+    dead = row("http://EXAMPLE.com/feed", dead_link=True, failure_count=4, etag='"old"',
+               last_polled_at=datetime(2026, 9, 1, tzinfo=timezone.utc))
+
+    merged, duplicates = merge_link_state([duplicate, dead, kept])
+
+    assert merged["link"] == "https://example.com/feed"
+    assert not merged["dead_link"]
+    assert (merged["etag"], merged["last_modified"], merged["content_hash"]) == \
+        ('"abc"', "Wed, 01 Oct 2026 11:00:00 GMT", "f00d")
+    assert merged["last_polled_at"] == polled and merged["entry_rate"] == 2.5
+    assert merged["poll_interval"] == 3600 and merged["failure_count"] == 0
+    assert sorted(duplicates) == ["http://EXAMPLE.com/feed", "http://example.com/feed/"]
+
+
+def test_merge_duplicate_links_runs_in_one_transaction(monkeypatch):
+    existing = row("https://example.com/feed", canonical_link="https://example.com/feed")
+    unmerged = [row("http://example.com/feed/?utm_source=newsletter", etag='"abc"',
+                    last_polled_at=datetime(2026, 10, 1, tzinfo=timezone.utc)),
+                row("https://other.example.org/rss")]
+    # Column DDL, then in the transaction: index, unmerged rows, rows already holding their canonical links, delete
+    conn = FakeCursor([], [], [],
+                      [tuple(r[c] for c in MERGED_COLUMNS) for r in unmerged],
+                      lambda params: [tuple(existing[c] for c in MERGED_COLUMNS)] if existing["canonical_link"] in params[0] else [])
+    transactions = []
+    updates = []
+
+    monkeypatch.setattr(RssUrlCanonicalizer, "get_connection", conn.get_connection)
+    monkeypatch.setattr(RssUrlCanonicalizer, "run_transaction", lambda database, func: transactions.append(func) or func(conn))
+    monkeypatch.setattr(RssUrlCanonicalizer.psycopg2.extras, "execute_values",
+                        lambda cursor, query, rows, template=None, page_size=None: updates.extend(rows))
+
+    assert merge_duplicate_links("crdb") == 1
+    assert len(transactions) == 1
+    assert conn.params[-1] == (["http://example.com/feed/?utm_source=newsletter"],)
+
+    kept = {values[0]: dict(zip(MERGED_COLUMNS, values)) for values in updates}
+    assert kept["https://example.com/feed"]["etag"] == '"abc"'
+    assert kept["https://other.example.org/rss"]["canonical_link"] == "https://other.example.org/rss"
+
+
+def test_insert_links_keeps_the_fetched_url_in_link(monkeypatch):
+    conn = FakeCursor()
+    inserted_rows = []
+
+    def execute_values(cursor, query, rows, page_size=None, fetch=False):
+        inserted_rows.extend(rows)
+        return [(link,) for _, link in rows]
+
+    monkeypatch.setattr(RssUrlCanonicalizer.psycopg2.extras, "execute_values", execute_values)
+    assert insert_links(conn, ["http://Example.com/feed/", "https://example.com/feed"]) == ["http://Example.com/feed/"]
+    assert inserted_rows == [("https://example.com/feed", "http://Example.com/feed/")]
@@ -0,0 +1,32 @@
+import pytest
+
+from RssWebFeedExtractor import WebsiteRssFeedExtractor
+
+PAGE = """<html><body>
+<a href="https://news.example.com/rss.xml">RSS</a>
+<a href="https://blog.example.org/feed/">Blog feed</a>
+<a href="https://example.com/lists/feeds.opml">OPML</a>
+<a href="/relative/feed">relative</a>
+<pre>Also available: https://plain.example.net/atom/feed.xml and https://example.com/about</pre>
+</body></html>"""
+
+
+@pytest.mark.parametrize("backend", ["lxml", "bs4"])
+def test_parse_for_rss_links_finds_anchor_and_plain_text_links(backend):
+    extractor = WebsiteRssFeedExtractor(backend=backend, incremental=False)
+    links, resources = extractor._parse_for_rss_links(PAGE)
+
+    assert links == {
+        "https://news.example.com/rss.xml",
+        "https://blog.example.org/feed/",
+        "https://example.com/lists/feeds.opml",
+        "https://plain.example.net/atom/feed.xml",
+    }
+    assert resources == []
+
+
+def test_extract_links_from_text_skips_known_links():
+    extractor = WebsiteRssFeedExtractor(incremental=False)
+    text = "https://a.example.com/feed https://b.example.com/rss.xml https://a.example.com/feed"
+    assert extractor._extract_links_from_text(text) == {"https://a.example.com/feed", "https://b.example.com/rss.xml"}
+    assert extractor._extract_links_from_text(text, known={"https://a.example.com/feed"}) == {"https://b.example.com/rss.xml"}
@@ -36,10 +36,45 @@ CREATE TABLE sentiment_indicators (
     entry_count INT NOT NULL
 );
 
+-- Parsed LLM analyses, one row per entry and analysis profile (analysis column name)
+CREATE TABLE rss_analysis (
+    entry_rowid INT8 NOT NULL,
+    profile STRING NOT NULL,
+    importance STRING,
+    sentiment STRING,
+    reason STRING,
+    raw JSONB,
+    analyzed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (entry_rowid, profile),
+    INDEX rss_analysis_profile_importance_idx (profile, importance)
+);
+
+-- Validators and extracted links of every document the website crawler fetched
+CREATE TABLE crawl_state (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    rss_links JSONB,
+    resources JSONB,
+    fetched_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Crawler candidates and the feed URL they were verified as (NULL if not a feed)
+CREATE TABLE feed_candidates (
+    url TEXT PRIMARY KEY,
+    feed_url TEXT,
+    checked_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
 ALTER TABLE rss_feed_websites ADD CONSTRAINT unique_website UNIQUE (website);
 
 ALTER TABLE rss_links ADD CONSTRAINT unique_link UNIQUE (link);
 
+-- One row per feed however its URL is spelled, see RssUrlCanonicalizer
+ALTER TABLE rss_links ADD COLUMN canonical_link TEXT;
+CREATE UNIQUE INDEX rss_links_canonical_link_key ON rss_links (canonical_link);
+
 
 
 -- Additional tables can be created similarly